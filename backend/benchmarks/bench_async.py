@@ -0,0 +1,179 @@
+'''
+Compares the throughput and latency of the sync Flask app under gunicorn
+sync workers with the async entry point under uvicorn, at the same
+worker count, against the database in DATABASE_URL.
+
+    pip install -r requirements-async.txt
+    python benchmarks/bench_async.py [--concurrency 256] [--workers 4]
+
+Each server is started in turn, warmed up, then loaded for --duration
+seconds by --concurrency keep-alive connections that each send the next
+request as soon as the last one is answered. Requests are a mix of
+question pages, category pages, the category list and quiz questions.
+'''
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+BACKEND = os.path.join(os.path.dirname(__file__), '..')
+
+SERVERS = {
+    'flask': ['gunicorn', '--chdir', BACKEND, '--workers', '{workers}',
+              '--bind', '127.0.0.1:{port}', '--log-level', 'warning',
+              'flaskr:APP'],
+    'asgi': ['uvicorn', '--app-dir', BACKEND, '--workers', '{workers}',
+             '--port', '{port}', '--log-level', 'warning', '--no-access-log',
+             'flaskr.asgi:APP'],
+}
+
+
+def next_request(rng, categories):
+    '''
+    Returns the (method, path, body) of a request in the benchmark mix
+    '''
+    kind = rng.random()
+    if kind < 0.4:
+        return 'GET', f'/api/questions?page={rng.randint(1, 5)}', None
+    if kind < 0.7:
+        return ('GET', f'/api/categories/{rng.choice(categories)}/questions',
+                None)
+    if kind < 0.8:
+        return 'GET', '/api/categories', None
+    return 'POST', '/api/quizzes', {
+        'previous_questions': [],
+        'quiz_category': {'id': rng.choice([0] + categories)},
+    }
+
+
+async def send_request(port, connection, method, path, body):
+    '''
+    Sends one request, reconnecting when the server closed the last
+    connection, and returns (status, connection)
+    '''
+    payload = json.dumps(body).encode() if body is not None else b''
+    head = (f'{method} {path} HTTP/1.1\r\nHost: 127.0.0.1\r\n'
+            f'Content-Type: application/json\r\n'
+            f'Content-Length: {len(payload)}\r\n\r\n').encode()
+    if connection is None:
+        connection = await asyncio.open_connection('127.0.0.1', port)
+    reader, writer = connection
+    writer.write(head + payload)
+    await writer.drain()
+
+    status_line, *header_lines = (
+        await reader.readuntil(b'\r\n\r\n')).decode('latin-1').split('\r\n')
+    headers = dict(line.lower().split(': ', 1)
+                   for line in header_lines if line)
+    if 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    else:
+        await reader.read()
+        headers['connection'] = 'close'
+
+    # gunicorn's sync workers close the connection after each response
+    if headers.get('connection') == 'close':
+        writer.close()
+        connection = None
+    return int(status_line.split()[1]), connection
+
+
+async def client(port, deadline, categories, seed, latencies, errors):
+    rng = random.Random(seed)
+    connection = None
+    while time.perf_counter() < deadline:
+        method, path, body = next_request(rng, categories)
+        start = time.perf_counter()
+        try:
+            status, connection = await send_request(port, connection,
+                                                    method, path, body)
+        except (OSError, asyncio.IncompleteReadError):
+            errors.append(path)
+            connection = None
+            continue
+        latencies.append(time.perf_counter() - start)
+        if status >= 500:
+            errors.append(path)
+    if connection is not None:
+        connection[1].close()
+
+
+async def load(port, concurrency, duration, categories):
+    latencies, errors = [], []
+    deadline = time.perf_counter() + duration
+    await asyncio.gather(*(client(port, deadline, categories, seed,
+                                  latencies, errors)
+                           for seed in range(concurrency)))
+    return latencies, errors
+
+
+async def wait_until_ready(port, timeout=30):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            status, connection = await send_request(
+                port, None, 'GET', '/api/categories', None)
+            if connection is not None:
+                connection[1].close()
+            if status == 200:
+                return
+        except (OSError, asyncio.IncompleteReadError):
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f'server on port {port} did not start')
+
+
+def run(name, args, categories):
+    command = [part.format(workers=args.workers, port=args.port)
+               for part in SERVERS[name]]
+    env = dict(os.environ, ASYNC_POOL_MAX_SIZE=str(args.pool_size))
+    server = subprocess.Popen(command, env=env)
+    try:
+        asyncio.run(wait_until_ready(args.port))
+        asyncio.run(load(args.port, min(args.concurrency, 32), 2, categories))
+        latencies, errors = asyncio.run(
+            load(args.port, args.concurrency, args.duration, categories))
+    finally:
+        server.terminate()
+        server.wait()
+
+    if not latencies:
+        print(f'  {name:<6} no responses, {len(errors)} errors')
+        return
+    latencies.sort()
+    print(f'  {name:<6} {len(latencies) / args.duration:10.0f} req/s'
+          f'  p50 {statistics.median(latencies) * 1000:8.1f} ms'
+          f'  p99 {latencies[int(len(latencies) * 0.99)] * 1000:8.1f} ms'
+          f'  errors {len(errors)}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--concurrency', type=int, default=256)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--pool-size', type=int, default=10,
+                        help='asyncpg connections per uvicorn worker')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--categories', type=int, default=6)
+    parser.add_argument('--servers', nargs='+', default=list(SERVERS),
+                        choices=list(SERVERS))
+    args = parser.parse_args()
+
+    if not os.environ.get('DATABASE_URL'):
+        sys.exit('Set DATABASE_URL to the database to benchmark against.')
+
+    categories = list(range(1, args.categories + 1))
+    print(f'{args.concurrency} connections, {args.workers} workers, '
+          f'{args.duration:g} s per server')
+    for name in args.servers:
+        run(name, args, categories)
+
+
+if __name__ == '__main__':
+    main()
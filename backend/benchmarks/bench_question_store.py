@@ -0,0 +1,96 @@
+'''
+Compares the memory and lookup latency of QuestionStore against one
+Question ORM instance per row.
+
+    python benchmarks/bench_question_store.py [--rows 1000000]
+
+ORM instances are measured on a sample of --orm-sample rows and scaled
+up, since materialising a million of them takes minutes.
+'''
+import argparse
+import os
+import random
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from flaskr.models import Question  # noqa: E402
+from flaskr.store import QuestionStore  # noqa: E402
+
+ANSWERS = ['Paris', 'Blood', 'Brazil', 'Agra', 'One', 'Escher', 'Scarab']
+
+
+def synthetic_rows(count, categories=6, seed=0):
+    rng = random.Random(seed)
+    for id in range(1, count + 1):
+        words = rng.randint(6, 18)
+        question = ' '.join(f'word{rng.randint(0, 5000)}'
+                            for _ in range(words)) + '?'
+        yield (id,
+               question,
+               rng.choice(ANSWERS),
+               rng.randint(1, categories),
+               rng.randint(1, 5))
+
+
+def measure(build):
+    tracemalloc.start()
+    result = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, size
+
+
+def orm_instances(rows):
+    instances = []
+    for id, question, answer, category, difficulty in rows:
+        instance = Question(question, answer, category, difficulty)
+        instance.id = id
+        instances.append(instance)
+    return instances
+
+
+def latency(label, statement, number=2000):
+    seconds = min(timeit.repeat(statement, number=number, repeat=3))
+    print(f'  {label:<38} {seconds / number * 1e6:10.2f} us')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--orm-sample', type=int, default=100000)
+    args = parser.parse_args()
+
+    rows = list(synthetic_rows(args.rows))
+    store, store_bytes = measure(lambda: QuestionStore(rows))
+
+    sample = rows[:args.orm_sample]
+    instances, sample_bytes = measure(lambda: orm_instances(sample))
+    orm_bytes = sample_bytes * args.rows / len(sample)
+
+    scale = 1000000 / args.rows
+    print(f'rows: {args.rows}')
+    print('memory per 1M questions (text shared by both):')
+    print(f'  QuestionStore {store_bytes * scale / 2 ** 20:10.1f} MiB')
+    print(f'  ORM instances {orm_bytes * scale / 2 ** 20:10.1f} MiB '
+          f'(scaled from {len(sample)})')
+
+    middle_page = len(store) // 20
+    previous = [random.randint(1, args.rows) for _ in range(20)]
+    print('lookup latency:')
+    latency('questions_range (page of 10)',
+            lambda: store.questions_range(middle_page, middle_page + 10))
+    latency('category_questions (page of 10)',
+            lambda: store.category_questions(3, 5000, 5010))
+    latency('random_question (category, 20 seen)',
+            lambda: store.random_question(3, previous))
+    latency('random_question (all, 20 seen)',
+            lambda: store.random_question(None, previous))
+    latency('ORM list page of 10 (format)',
+            lambda: [q.format() for q in instances[5000:5010]])
+
+
+if __name__ == '__main__':
+    main()
@@ -1,37 +1,237 @@
 import os
-from flask import Flask, request, abort, jsonify
+import time
+import functools
+import hmac
+from flask import (Flask, Response, request, abort, jsonify,
+                   stream_with_context)
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime
 import random
 import json
 
-from .models import setup_db, Question, Category
+from .models import (setup_db, db, content_hash, Question, Category,
+                     QuizResult, QuestionChange)
+from .store import QuestionRepository
+from .profiling import RequestProfiler
+from .cache import LRUCache, ResponseCache
+from .writebehind import WriteBehindBuffer
 
 QUESTIONS_PER_PAGE = 10
+CORS_ORIGINS = "https://trivia4you.herokuapp.com/*"
+# Batch lookups fetch ids in IN lists of at most this many
+ID_CHUNK_SIZE = 500
+MAX_BATCH_IDS = 10000
+# Most changes returned by one GET /api/changes
+MAX_CHANGES = 1000
+# Most pairs returned by one GET /api/admin/near-duplicates, and most
+# signatures it compares, about 50 MB of them
+MAX_NEAR_DUPLICATES = 10000
+MAX_SCANNED_SIGNATURES = 100000
+# Query arguments a cached response may vary on, requests with any other
+# argument bypass the response cache
+CACHED_ARGS = ('page',)
+
+
+def page_bounds(request):
+    # pages before the first are the first page, a negative offset is an
+    # error on Postgres
+    page = max(request.args.get('page', 1, type=int), 1)
+    start = (page - 1)*QUESTIONS_PER_PAGE
+    end = start + QUESTIONS_PER_PAGE
+
+    return start, end
 
 
 def paginate_questions(request, selection):
-    page = request.args.get('page', 1, type=int)
-    start = (page - 1)*QUESTIONS_PER_PAGE
-    end = start + QUESTIONS_PER_PAGE
+    start, end = page_bounds(request)
 
-    format_questions = [q.format() for q in selection]
-    current_questions = format_questions[start:end]
+    # selection is a query, so only the requested page is fetched
+    current_questions = [q.format() for q in
+                         selection.offset(start).limit(end - start)]
 
     return current_questions
 
 
+def parse_ids(ids):
+    '''
+    Returns the ids of a comma separated string or a list, without
+    duplicates and in request order, or aborts with 400
+    '''
+    if isinstance(ids, str):
+        ids = [id for id in ids.split(',') if id.strip()]
+    if not isinstance(ids, list) or len(ids) > MAX_BATCH_IDS:
+        abort(400)
+    try:
+        return list(dict.fromkeys(int(id) for id in ids))
+    except (TypeError, ValueError):
+        abort(400)
+
+
+def quiz_answer(body, quiz_category):
+    '''
+    Returns the quiz_results row of the answer a quiz request carries, or
+    None when it has none, or aborts with 400
+    '''
+    answer = body.get('answer')
+    if answer is None:
+        return None
+    if (not isinstance(answer, dict) or
+            not isinstance(answer.get('question_id'), int) or
+            not isinstance(answer.get('correct'), bool)):
+        abort(400)
+
+    try:
+        quiz_category = int(quiz_category) or None
+    except (TypeError, ValueError):
+        quiz_category = None
+    score = body.get('score')
+    quiz_id = body.get('quiz_id')
+
+    return {
+      'quiz_id': str(quiz_id)[:64] if quiz_id is not None else None,
+      'question_id': answer['question_id'],
+      'quiz_category': quiz_category,
+      'correct': answer['correct'],
+      'score': score if isinstance(score, int) else None,
+      'answered_at': datetime.utcnow(),
+    }
+
+
+def duplicate_question(question):
+    return jsonify({
+      'success': False,
+      'error': 409,
+      'message': 'Duplicate Question',
+      'question_id': question.id
+    }), 409
+
+
+class Rendered(Exception):
+    '''
+    Carries a response that must not be cached out of a cache build
+    '''
+
+    def __init__(self, response):
+        self.response = response
+
+
 def create_app(test_config=None):
     # create and configure the app
     app = Flask(__name__)
+    app.config.from_mapping(
+        # Serve reads from an in-memory QuestionStore instead of the ORM
+        QUESTION_STORE=os.environ.get('QUESTION_STORE') == 'on',
+        # Seconds before the store is reloaded to pick up outside writes
+        QUESTION_STORE_TTL=int(os.environ.get('QUESTION_STORE_TTL', 60)),
+        # NDJSON file for statements slower than SLOW_QUERY_THRESHOLD_MS,
+        # the slow query log is off while this is empty
+        SLOW_QUERY_LOG=os.environ.get('SLOW_QUERY_LOG'),
+        SLOW_QUERY_THRESHOLD_MS=float(
+            os.environ.get('SLOW_QUERY_THRESHOLD_MS', 100)),
+        SLOW_QUERY_LOG_MAX_BYTES=int(
+            os.environ.get('SLOW_QUERY_LOG_MAX_BYTES', 10 * 2 ** 20)),
+        SLOW_QUERY_LOG_BACKUPS=int(
+            os.environ.get('SLOW_QUERY_LOG_BACKUPS', 5)),
+        # Directory for cProfile dumps, request profiling is off while
+        # this is empty. Requests are profiled when their X-Profile header
+        # matches PROFILE_TOKEN, or at random at PROFILE_SAMPLE_RATE.
+        PROFILE_DIR=os.environ.get('PROFILE_DIR'),
+        PROFILE_TOKEN=os.environ.get('PROFILE_TOKEN'),
+        PROFILE_SAMPLE_RATE=float(os.environ.get('PROFILE_SAMPLE_RATE', 0)),
+        PROFILE_MAX_PER_MINUTE=int(
+            os.environ.get('PROFILE_MAX_PER_MINUTE', 10)),
+        PROFILE_FLAMEGRAPH=os.environ.get('PROFILE_FLAMEGRAPH') == 'on',
+        # Formatted questions kept per id for batch lookups, 0 disables
+        QUESTION_CACHE_SIZE=int(os.environ.get('QUESTION_CACHE_SIZE', 0)),
+        QUESTION_CACHE_TTL=int(os.environ.get('QUESTION_CACHE_TTL', 300)),
+        # Bytes of rendered question pages kept in memory, 0 disables
+        RESPONSE_CACHE_MAX_BYTES=int(
+            os.environ.get('RESPONSE_CACHE_MAX_BYTES', 0)),
+        # Check new questions for near-duplicates as they are added, and
+        # the estimated similarity that makes two questions near-duplicates
+        NEAR_DUPLICATES=os.environ.get('NEAR_DUPLICATES') == 'on',
+        # the default is minhash.THRESHOLD, which is not imported here
+        NEAR_DUPLICATE_THRESHOLD=float(
+            os.environ.get('NEAR_DUPLICATE_THRESHOLD', 0.7)),
+        # Bearer token of the /api/admin endpoints, which are off while
+        # this is empty
+        ADMIN_TOKEN=os.environ.get('ADMIN_TOKEN'),
+        # Quiz answers are buffered and inserted in batches of this many
+        # rows, or after this many seconds
+        QUIZ_RESULTS_BATCH_SIZE=int(
+            os.environ.get('QUIZ_RESULTS_BATCH_SIZE', 500)),
+        QUIZ_RESULTS_FLUSH_INTERVAL=float(
+            os.environ.get('QUIZ_RESULTS_FLUSH_INTERVAL', 1.0)),
+        QUIZ_RESULTS_CAPACITY=int(
+            os.environ.get('QUIZ_RESULTS_CAPACITY', 10000)),
+        # Connections of each flaskr.asgi worker's asyncpg pool
+        ASYNC_POOL_MIN_SIZE=int(os.environ.get('ASYNC_POOL_MIN_SIZE', 2)),
+        ASYNC_POOL_MAX_SIZE=int(os.environ.get('ASYNC_POOL_MAX_SIZE', 10)),
+        # The change stream polls the change log this often and closes
+        # after CHANGE_STREAM_TIMEOUT seconds, below gunicorn's default
+        # worker timeout; EventSource clients reconnect by themselves
+        CHANGE_STREAM_POLL_INTERVAL=float(
+            os.environ.get('CHANGE_STREAM_POLL_INTERVAL', 1.0)),
+        CHANGE_STREAM_TIMEOUT=float(
+            os.environ.get('CHANGE_STREAM_TIMEOUT', 25)),
+    )
+    if test_config is not None:
+        app.config.update(test_config)
 
     setup_db(app)
 
+    if app.config['PROFILE_DIR']:
+        profiler = RequestProfiler(app.config['PROFILE_DIR'],
+                                   app.config['PROFILE_TOKEN'],
+                                   app.config['PROFILE_SAMPLE_RATE'],
+                                   app.config['PROFILE_MAX_PER_MINUTE'],
+                                   app.config['PROFILE_FLAMEGRAPH'])
+        profiler.init_app(app)
+
+    quiz_results = WriteBehindBuffer(app, QuizResult.__table__,
+                                     app.config['QUIZ_RESULTS_BATCH_SIZE'],
+                                     app.config['QUIZ_RESULTS_FLUSH_INTERVAL'],
+                                     app.config['QUIZ_RESULTS_CAPACITY'])
+    app.extensions['quiz_results'] = quiz_results
+
+    # near-duplicate detection needs NumPy, which is only imported when
+    # one of its features is on
+    if app.config['NEAR_DUPLICATES'] or app.config['ADMIN_TOKEN']:
+        from . import minhash
+
+    question_cache = None
+    if app.config['QUESTION_CACHE_SIZE']:
+        question_cache = LRUCache(app.config['QUESTION_CACHE_SIZE'],
+                                  app.config['QUESTION_CACHE_TTL'])
+
+    response_cache = None
+    if app.config['RESPONSE_CACHE_MAX_BYTES']:
+        response_cache = ResponseCache(app.config['RESPONSE_CACHE_MAX_BYTES'])
+    app.extensions['response_cache'] = response_cache
+
+    def data_generation():
+        # every write adds a change, so the latest seq changes whenever
+        # any worker writes, and entries of older generations are never
+        # read again and age out of the cache
+        return db.session.query(func.max(QuestionChange.seq)).scalar() or 0
+
+    question_store = None
+    if app.config['QUESTION_STORE']:
+        # pages cached under a generation must not be rendered from a
+        # store loaded before it, so with the response cache the store
+        # follows the change log instead of waiting for its ttl
+        question_store = QuestionRepository(
+            app.config['QUESTION_STORE_TTL'],
+            data_generation if response_cache is not None else None)
+
     '''
     Done: Set up CORS. Allow '*' for origins.
     Delete the sample route after completing the TODOs
     '''
-    cors = CORS(app, resources={r"/api/*": {"origins": "https://trivia4you.herokuapp.com/*"}})
+    cors = CORS(app, resources={r"/api/*": {"origins": CORS_ORIGINS}})
     '''
     Done: Use the after_request decorator to set Access-Control-Allow
     '''
@@ -54,6 +254,108 @@ def create_app(test_config=None):
 
         return categories
 
+    def questions_by_ids(ids, cached=True):
+        '''
+        Returns the formatted questions of ids in the same order, and the
+        ids that do not exist. With cached False the question cache is
+        neither read nor filled.
+        '''
+        found = {}
+        if cached and question_cache is not None:
+            for id in ids:
+                cached = question_cache.get(id)
+                if cached is not None:
+                    found[id] = cached
+
+        uncached = [id for id in ids if id not in found]
+        for start in range(0, len(uncached), ID_CHUNK_SIZE):
+            chunk = uncached[start:start + ID_CHUNK_SIZE]
+            for question in Question.query.filter(Question.id.in_(chunk)):
+                found[question.id] = question.format()
+                if cached and question_cache is not None:
+                    question_cache.set(question.id, found[question.id])
+
+        questions = [found[id] for id in ids if id in found]
+        missing = [id for id in ids if id not in found]
+        return questions, missing
+
+    def record_answer(body, quiz_category):
+        '''
+        Queues the answer to the previous quiz question, if the request
+        carries one, without writing to the database on this request
+        '''
+        row = quiz_answer(body, quiz_category)
+        if row is not None:
+            quiz_results.add(row)
+
+    def changes_since(since, limit=MAX_CHANGES):
+        '''
+        Returns the formatted changes after seq since, with the current
+        question attached to inserts and updates
+        '''
+        changes = QuestionChange.query.filter(
+            QuestionChange.seq > since
+            ).order_by(QuestionChange.seq).limit(limit).all()
+
+        changed_ids = list(dict.fromkeys(
+            change.question_id for change in changes
+            if change.operation in ('insert', 'update')))
+        # the cache only forgets a question on a delete in this process,
+        # so an update would ship the text from before it
+        questions, _ = questions_by_ids(changed_ids, cached=False)
+        questions = {question['id']: question for question in questions}
+
+        formatted_changes = []
+        for change in changes:
+            formatted_change = change.format()
+            if change.operation in ('insert', 'update'):
+                # None when the question was deleted by a later change
+                formatted_change['question'] = questions.get(
+                    change.question_id)
+            formatted_changes.append(formatted_change)
+        return formatted_changes
+
+    def cached_response(view):
+        '''
+        Serves the view's rendered body from the response cache, keyed on
+        path, normalized query string and data generation. Only 200
+        responses are cached.
+        '''
+        @functools.wraps(view)
+        def cached_view(**kwargs):
+            if (response_cache is None or
+                    any(arg not in CACHED_ARGS for arg in request.args)):
+                return view(**kwargs)
+
+            query = (('page', request.args.get('page', 1, type=int)),)
+            key = (request.path, query, data_generation())
+
+            def build():
+                response = app.make_response(view(**kwargs))
+                if response.status_code != 200:
+                    raise Rendered(response)
+                return response.get_data(), response.mimetype
+
+            try:
+                entry, hit = response_cache.get_or_build(key, build)
+            except Rendered as rendered:
+                rendered.response.headers['X-Cache'] = 'BYPASS'
+                return rendered.response
+            response = Response(entry[0], mimetype=entry[1])
+            response.headers['X-Cache'] = 'HIT' if hit else 'MISS'
+            return response
+
+        return cached_view
+
+    def batch_response(ids):
+        questions, missing = questions_by_ids(parse_ids(ids))
+        return jsonify({
+          'success': True,
+          'questions': questions,
+          'missing': missing,
+          'total_questions': len(questions)
+        })
+
     @app.route('/')
     def check_status():
         return "Healthy"
@@ -90,22 +392,37 @@ def create_app(test_config=None):
     Clicking on the page numbers should update the questions.
     '''
     @app.route('/api/questions')
+    @cached_response
     def all_questions():
-        selection = Question.query.order_by(Question.id).all()
-        current_questions = paginate_questions(request, selection)
-
-        if len(current_questions) == 0:
-            abort(404)
-
-        current_categories = []
-        for q in selection:
-            if q.category not in current_categories:
-                current_categories.append(q.category)
+        if 'ids' in request.args:
+            return batch_response(request.args['ids'])
+
+        if question_store is not None:
+            store = question_store.get()
+            current_questions = store.questions_range(*page_bounds(request))
+            if len(current_questions) == 0:
+                abort(404)
+            total_questions = len(store)
+            current_categories = store.current_categories
+        else:
+            selection = Question.query.order_by(Question.id)
+            current_questions = paginate_questions(request, selection)
+            if len(current_questions) == 0:
+                abort(404)
+            total_questions = Question.query.count()
+
+            # categories in order of their first question
+            current_categories = [
+                category for (category,) in
+                db.session.query(Question.category)
+                          .group_by(Question.category)
+                          .order_by(func.min(Question.id))
+            ]
 
         return jsonify({
           'success': True,
           'questions': current_questions,
-          'total_questions': len(selection),
+          'total_questions': total_questions,
           'current_category': current_categories,
           'categories': categories_list(),
         })
@@ -119,6 +436,17 @@ def create_app(test_config=None):
     This removal will persist in the database and when you refresh the page.
     '''
 
+    @app.route('/api/questions/<int:question_id>')
+    def get_question(question_id):
+        questions, missing = questions_by_ids([question_id])
+        if missing:
+            abort(404)
+
+        return jsonify({
+          'success': True,
+          'question': questions[0]
+        })
+
     @app.route('/api/questions/<question_id>', methods=['DELETE'])
     def question_by_id(question_id):
         try:
@@ -127,7 +455,11 @@ def create_app(test_config=None):
                                              ).one_or_none()
 
             question.delete()
-            selection = Question.query.order_by(Question.id).all()
+            if question_store is not None:
+                question_store.invalidate()
+            if question_cache is not None:
+                question_cache.delete(question.id)
+            selection = Question.query.order_by(Question.id)
             current_questions = paginate_questions(request, selection)
 
             return jsonify({
@@ -166,11 +498,16 @@ def create_app(test_config=None):
         new_difficulty = body.get('difficulty', None)
         search_term = body.get('searchTerm', None)
 
+        # long id lists are posted instead of sent in the query string
+        if 'ids' in body:
+            return batch_response(body['ids'])
+
         try:
             if search_term:
                 searched_questions = Question.query.filter(
                                                            Question.question.ilike(f"%{search_term}%")
-                                                           ).all()
+                                                           )
+                searched_questions = searched_questions.order_by(Question.id)
                 p_questions = paginate_questions(request, searched_questions)
 
                 return jsonify({
@@ -184,29 +521,55 @@ def create_app(test_config=None):
                 if new_question == '' or new_answer == '':
                     abort(422)
 
+                # the unique content hash index makes this an O(1) lookup
+                existing = Question.query.filter(
+                    Question.content_hash == content_hash(new_question,
+                                                          new_answer)
+                    ).one_or_none()
+                if existing is not None:
+                    return duplicate_question(existing)
+
                 new_question = Question(question=new_question,
                                         answer=new_answer,
                                         category=new_category,
                                         difficulty=new_difficulty
                                         )
-                new_question.insert()
-
-                selection = Question.query.order_by(Question.id).all()
+                try:
+                    new_question.insert()
+                except IntegrityError:
+                    # a concurrent request inserted the same question
+                    db.session.rollback()
+                    return duplicate_question(Question.query.filter(
+                        Question.content_hash == new_question.content_hash
+                        ).one())
+                if question_store is not None:
+                    question_store.invalidate()
+
+                selection = Question.query.order_by(Question.id)
                 current_questions = paginate_questions(request, selection)
-                posted_question = Question.query.filter(
-                                                        Question.answer == new_question.answer
-                                                        ).one_or_none()
 
-                return jsonify({
+                response = {
                   'success': True,
-                  'question_id': posted_question.id,
+                  'question_id': new_question.id,
                   'questions': current_questions,
-                  'total_questions': len(selection)
-                })
+                  'total_questions': Question.query.count()
+                }
 
         except:
             abort(422)
 
+        # the question is committed by now, so a failed check is logged
+        # and left out of the response instead of failing the request
+        if app.config['NEAR_DUPLICATES']:
+            try:
+                response['near_duplicates'] = minhash.check_question(
+                    new_question, app.config['NEAR_DUPLICATE_THRESHOLD'])
+            except Exception:
+                db.session.rollback()
+                app.logger.exception('near-duplicate check of question %d '
+                                     'failed', response['question_id'])
+        return jsonify(response)
+
     '''
     Done:
     Create a GET endpoint to get questions based on category.
@@ -216,13 +579,19 @@ def create_app(test_config=None):
     category to be shown.
     '''
     @app.route('/api/categories/<category_id>/questions')
+    @cached_response
     def questions_by_category(category_id):
         # get questions with category id == to category_id
         try:
-            questions = Question.query.filter(
-                                              Question.category == category_id
-                                              ).all()
-            current_questions = paginate_questions(request, questions)
+            if question_store is not None:
+                current_questions = question_store.get().category_questions(
+                    category_id, *page_bounds(request))
+            else:
+                questions = Question.query.filter(
+                                                  Question.category == category_id
+                                                  )
+                current_questions = paginate_questions(
+                    request, questions.order_by(Question.id))
 
             return jsonify({
               'success': True,
@@ -253,34 +622,143 @@ def create_app(test_config=None):
         previous_question = body.get('previous_questions', None)
         category = body.get('quiz_category')
         current_category = category.get('id')
+        record_answer(body, current_category)
 
-        if current_category != 0:
-            current_questions = Question.query.filter(
-                                                      Question.category == current_category
-                                                      ).all()
-        else:
-            current_questions = Question.query.all()
+        if question_store is not None:
+            store = question_store.get()
+            offset, remaining = store.random_question(
+                current_category if current_category != 0 else None,
+                previous_question or ())
+
+            if offset is None:
+                return jsonify({
+                  'success': True,
+                  'total_questions': 0
+                })
 
-        questions = []
-        for q in current_questions:
-            if q.id not in previous_question:
-                questions.append(q)
+            return jsonify({
+              'success': True,
+              'question': store.format(offset),
+              'total_questions': remaining,
+            })
 
-        if len(questions) == 0:
+        questions = Question.query
+        if current_category != 0:
+            questions = questions.filter(Question.category == current_category)
+        if previous_question:
+            questions = questions.filter(~Question.id.in_(previous_question))
+
+        total_questions = questions.count()
+        if total_questions == 0:
             return jsonify({
               'success': True,
               'total_questions': 0
             })
 
-        random_question = random.choice(questions)
+        # fetch only the randomly chosen row
+        random_question = questions.order_by(Question.id).offset(
+            random.randrange(total_questions)).first()
         format_question = random_question.format()
         # return random question
         return jsonify({
           'success': True,
           'question': format_question,
-          'total_questions': len(questions),
+          'total_questions': total_questions,
         })
     '''
+    Change feed: clients keep a local copy of the questions current by
+    fetching the changes after the last seq they saw, instead of
+    refetching whole pages.
+    '''
+    @app.route('/api/changes')
+    def changes():
+        since = request.args.get('since', 0, type=int)
+        limit = min(max(request.args.get('limit', MAX_CHANGES, type=int),
+                        1), MAX_CHANGES)
+        current_changes = changes_since(since, limit)
+
+        return jsonify({
+          'success': True,
+          'changes': current_changes,
+          'latest': current_changes[-1]['seq'] if current_changes else since,
+          'more': len(current_changes) == limit
+        })
+
+    @app.route('/api/changes/stream')
+    def changes_stream():
+        # EventSource sends the last id it received when it reconnects
+        since = request.headers.get('Last-Event-ID', type=int)
+        if since is None:
+            since = request.args.get('since', 0, type=int)
+        poll_interval = app.config['CHANGE_STREAM_POLL_INTERVAL']
+        deadline = time.monotonic() + app.config['CHANGE_STREAM_TIMEOUT']
+
+        def stream(since):
+            yield 'retry: 1000\n\n'
+            while time.monotonic() < deadline:
+                current_changes = changes_since(since)
+                # release the connection while waiting for the next poll
+                db.session.close()
+                for change in current_changes:
+                    since = change['seq']
+                    yield (f'id: {since}\nevent: change\n'
+                           f'data: {json.dumps(change)}\n\n')
+                if len(current_changes) < MAX_CHANGES:
+                    yield ': keep-alive\n\n'
+                    time.sleep(poll_interval)
+
+        return Response(stream_with_context(stream(since)),
+                        mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache',
+                                 'X-Accel-Buffering': 'no'})
+
+    @app.route('/api/metrics')
+    def metrics():
+        return jsonify({
+          'success': True,
+          'quiz_results': quiz_results.stats(),
+          'response_cache': (response_cache.stats() if response_cache
+                             is not None else None)
+        })
+
+    def require_admin():
+        token = app.config['ADMIN_TOKEN']
+        if not token:
+            abort(404)
+        header = request.headers.get('Authorization', '')
+        # bytes, since compare_digest rejects non-ASCII str
+        if not hmac.compare_digest(header.encode(),
+                                   f'Bearer {token}'.encode()):
+            abort(401)
+
+    @app.route('/api/admin/near-duplicates')
+    def near_duplicates():
+        require_admin()
+        threshold = request.args.get(
+            'threshold', app.config['NEAR_DUPLICATE_THRESHOLD'], type=float)
+        limit = request.args.get('limit', 100, type=int)
+        after = request.args.get('after', 0, type=int)
+        if not 0 < threshold <= 1 or not 0 < limit <= MAX_NEAR_DUPLICATES:
+            abort(400)
+
+        # only reads the index, questions added without the check, such
+        # as bulk loads, are indexed by manage.py near-duplicates. One
+        # request compares a window of signatures, the command compares
+        # all of them.
+        ids, loaded = minhash.load_signatures(after, MAX_SCANNED_SIGNATURES)
+        pairs = minhash.similar_pairs(ids, loaded, threshold, limit)
+
+        return jsonify({
+          'success': True,
+          'unindexed': minhash.unindexed(),
+          'pairs': [{'question_ids': [first, second],
+                     'similarity': score}
+                    for first, second, score in pairs],
+          'next_after': (int(ids[-1]) if len(ids) == MAX_SCANNED_SIGNATURES
+                         else None)
+        })
+
+    '''
     Done:
     Create error handlers for all expected errors
     including 404 and 422.
@@ -293,6 +771,14 @@ def create_app(test_config=None):
           'message': 'Bad Request'
         }), 400
 
+    @app.errorhandler(401)
+    def unauthorized(error):
+        return jsonify({
+          'success': False,
+          'error': 401,
+          'message': 'Unauthorized'
+        }), 401
+
     @app.errorhandler(404)
     def not_found(error):
         return jsonify({
@@ -0,0 +1,284 @@
+import asyncio
+import json
+import random
+import re
+from urllib.parse import parse_qsl
+
+import asyncpg
+from asgiref.wsgi import WsgiToAsgi
+from werkzeug.datastructures import MultiDict
+from werkzeug.exceptions import HTTPException, abort
+
+from . import APP as FLASK_APP, CORS_ORIGINS, page_bounds, quiz_answer
+
+'''
+AsyncTrivia
+    an ASGI application that serves the read and quiz endpoints with
+    async handlers over an asyncpg pool of at most max_size connections,
+    so a request waiting on the database holds a connection rather than
+    a worker. Every other route is passed to the Flask app. Responses
+    are the same JSON as the Flask views' database path; the in-memory
+    question store and the response cache are not used.
+
+        uvicorn --app-dir backend flaskr.asgi:APP
+'''
+
+# The same bodies as the Flask error handlers
+ERROR_MESSAGES = {
+    400: 'Bad Request',
+    401: 'Unauthorized',
+    404: 'Resource Not Found',
+    422: 'Unprocessable Request',
+    500: 'Internal Server Error',
+}
+
+QUESTION_COLUMNS = 'id, question, answer, category, difficulty'
+
+# category is compared as text, since databases restored from the dumps
+# store it as an integer and those created by the migrations as a string
+QUESTIONS_PAGE = (f'SELECT {QUESTION_COLUMNS} FROM questions '
+                  'ORDER BY id LIMIT $1 OFFSET $2')
+CATEGORY_PAGE = (f'SELECT {QUESTION_COLUMNS} FROM questions '
+                 'WHERE category::text = $1 ORDER BY id LIMIT $2 OFFSET $3')
+CURRENT_CATEGORIES = ('SELECT category FROM questions GROUP BY category '
+                      'ORDER BY min(id)')
+
+
+class Request:
+
+    def __init__(self, scope):
+        self.method = scope['method']
+        self.path = scope['path']
+        query = scope['query_string'].decode('latin-1')
+        self.args = MultiDict(parse_qsl(query, keep_blank_values=True))
+        self.headers = {name.decode('latin-1').lower():
+                        value.decode('latin-1')
+                        for name, value in scope['headers']}
+        self.body = b''
+
+    async def read_body(self, receive):
+        while True:
+            message = await receive()
+            self.body += message.get('body', b'')
+            if not message.get('more_body'):
+                return
+
+    def get_json(self):
+        '''
+        Returns the parsed body of a JSON request, None for other content
+        types, or aborts with 400 like Flask
+        '''
+        if self.headers.get('content-type', '').split(';')[0] != \
+                'application/json':
+            return None
+        try:
+            return json.loads(self.body)
+        except ValueError:
+            abort(400)
+
+
+class AsyncTrivia:
+
+    def __init__(self, flask_app, min_size=2, max_size=10):
+        self.flask_app = flask_app
+        self.wsgi = WsgiToAsgi(flask_app)
+        # asyncpg takes plain postgresql:// urls, without a driver name
+        self.dsn = re.sub(r'^postgres(ql)?(\+\w+)?://', 'postgresql://',
+                          flask_app.config['SQLALCHEMY_DATABASE_URI'])
+        self.min_size = min_size
+        self.max_size = max_size
+        self.origins = re.compile(CORS_ORIGINS, re.IGNORECASE)
+        self.routes = [
+            ('GET', re.compile(r'/api/categories'), self.all_categories),
+            ('GET', re.compile(r'/api/questions'), self.all_questions),
+            ('GET', re.compile(r'/api/categories/(?P<category_id>[^/]+)'
+                               r'/questions'), self.questions_by_category),
+            ('POST', re.compile(r'/api/quizzes'), self.quizzes),
+        ]
+        self.pool = None
+        self._pool_lock = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+
+        if scope['type'] == 'http':
+            for method, pattern, handler in self.routes:
+                match = pattern.fullmatch(scope['path'])
+                if match is None or scope['method'] != method:
+                    continue
+                request = Request(scope)
+                # batch lookups keep their Flask view and cache
+                if handler == self.all_questions and 'ids' in request.args:
+                    break
+                await request.read_body(receive)
+                await self.respond(send, request, handler,
+                                   **match.groupdict())
+                return
+
+        await self.wsgi(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    await self.get_pool()
+                except Exception as error:
+                    await send({'type': 'lifespan.startup.failed',
+                                'message': str(error)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self.pool is not None:
+                    await self.pool.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def get_pool(self):
+        if self.pool is not None:
+            return self.pool
+        # created on first use when the server does not run lifespan
+        if self._pool_lock is None:
+            self._pool_lock = asyncio.Lock()
+        async with self._pool_lock:
+            if self.pool is None:
+                self.pool = await asyncpg.create_pool(
+                    self.dsn, min_size=self.min_size, max_size=self.max_size)
+        return self.pool
+
+    async def respond(self, send, request, handler, **kwargs):
+        try:
+            status, body = 200, await handler(request, **kwargs)
+        except HTTPException as error:
+            status = error.code
+            body = {'success': False, 'error': error.code,
+                    'message': ERROR_MESSAGES.get(error.code, error.name)}
+        except Exception:
+            self.flask_app.logger.exception('Exception on %s [%s]',
+                                            request.path, request.method)
+            status = 500
+            body = {'success': False, 'error': 500,
+                    'message': ERROR_MESSAGES[500]}
+
+        # encoded like Flask's jsonify
+        payload = (json.dumps(body, sort_keys=True, separators=(',', ':')) +
+                   '\n').encode('utf-8')
+        headers = [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(payload)).encode('latin-1')),
+            (b'access-control-allow-headers',
+             b'Content-Type,Authorization,true'),
+            (b'access-control-allow-methods', b'POST,GET,PATCH,DELETE'),
+        ]
+        origin = request.headers.get('origin')
+        if origin and self.origins.match(origin):
+            headers.append((b'access-control-allow-origin',
+                            origin.encode('latin-1')))
+            headers.append((b'vary', b'Origin'))
+
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': headers})
+        await send({'type': 'http.response.body', 'body': payload})
+
+    async def categories_list(self, connection):
+        rows = await connection.fetch('SELECT id, type FROM categories')
+        return {id: type for id, type in rows}
+
+    async def all_categories(self, request):
+        pool = await self.get_pool()
+        async with pool.acquire() as connection:
+            categories = await self.categories_list(connection)
+
+        return {
+          'success': True,
+          'categories': categories,
+          'total_categories': len(categories)
+        }
+
+    async def all_questions(self, request):
+        start, end = page_bounds(request)
+        pool = await self.get_pool()
+        async with pool.acquire() as connection:
+            rows = await connection.fetch(QUESTIONS_PAGE, end - start, start)
+            if len(rows) == 0:
+                abort(404)
+            total_questions = await connection.fetchval(
+                'SELECT count(*) FROM questions')
+            current_categories = [category for (category,) in
+                                  await connection.fetch(CURRENT_CATEGORIES)]
+            categories = await self.categories_list(connection)
+
+        return {
+          'success': True,
+          'questions': [dict(row) for row in rows],
+          'total_questions': total_questions,
+          'current_category': current_categories,
+          'categories': categories,
+        }
+
+    async def questions_by_category(self, request, category_id):
+        try:
+            start, end = page_bounds(request)
+            pool = await self.get_pool()
+            async with pool.acquire() as connection:
+                rows = await connection.fetch(CATEGORY_PAGE, category_id,
+                                              end - start, start)
+        except Exception:
+            abort(404)
+
+        return {
+          'success': True,
+          'questions': [dict(row) for row in rows],
+          'total_questions': len(rows),
+          'current_category': category_id
+        }
+
+    async def quizzes(self, request):
+        body = request.get_json()
+        previous_question = body.get('previous_questions', None)
+        category = body.get('quiz_category')
+        current_category = category.get('id')
+        row = quiz_answer(body, current_category)
+        if row is not None:
+            # queuing only takes a lock, the flush runs on its own thread
+            self.flask_app.extensions['quiz_results'].add(row)
+
+        conditions, parameters = [], []
+        if current_category is None:
+            conditions.append('category IS NULL')
+        elif current_category != 0:
+            parameters.append(str(current_category))
+            conditions.append(f'category::text = ${len(parameters)}')
+        if previous_question:
+            parameters.append([int(id) for id in previous_question])
+            conditions.append(f'id <> ALL(${len(parameters)}::int[])')
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+
+        pool = await self.get_pool()
+        async with pool.acquire() as connection:
+            total_questions = await connection.fetchval(
+                f'SELECT count(*) FROM questions {where}', *parameters)
+            if total_questions == 0:
+                return {
+                  'success': True,
+                  'total_questions': 0
+                }
+
+            # fetch only the randomly chosen row
+            offset = random.randrange(total_questions)
+            question = await connection.fetchrow(
+                f'SELECT {QUESTION_COLUMNS} FROM questions {where} '
+                f'ORDER BY id LIMIT 1 OFFSET {offset}', *parameters)
+
+        return {
+          'success': True,
+          'question': dict(question),
+          'total_questions': total_questions,
+        }
+
+
+APP = AsyncTrivia(FLASK_APP,
+                  FLASK_APP.config['ASYNC_POOL_MIN_SIZE'],
+                  FLASK_APP.config['ASYNC_POOL_MAX_SIZE'])
@@ -0,0 +1,58 @@
+import io
+from contextlib import contextmanager
+
+from .models import db
+
+'''
+bulk
+    loads rows with COPY, the fastest bulk path on Postgres. COPY cannot
+    skip conflicting rows, so rows fill a staging table that is then
+    inserted with ON CONFLICT DO NOTHING on the table's unique key.
+'''
+
+
+@contextmanager
+def raw_cursor():
+    '''
+    Yields a psycopg2 cursor of its own connection, committed when the
+    block completes
+    '''
+    connection = db.engine.raw_connection()
+    try:
+        yield connection.cursor()
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def copy_rows(cursor, table, columns, key, rows):
+    '''
+    Inserts rows, tuples in the order of the comma separated columns,
+    into table, skipping rows that conflict on key. Returns the number of
+    rows inserted.
+    '''
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write('\t'.join(_copy_escape(value) for value in row))
+        buffer.write('\n')
+    buffer.seek(0)
+
+    staging = f'{table}_staging'
+    cursor.execute(f'CREATE TEMP TABLE {staging} ON COMMIT DROP '
+                   f'AS SELECT {columns} FROM {table} WITH NO DATA')
+    cursor.copy_expert(f'COPY {staging} ({columns}) FROM STDIN', buffer)
+    cursor.execute(f'INSERT INTO {table} ({columns}) '
+                   f'SELECT {columns} FROM {staging} '
+                   f'ON CONFLICT ({key}) DO NOTHING')
+    return cursor.rowcount
+
+
+def _copy_escape(value):
+    if value is None:
+        return '\\N'
+    if isinstance(value, bytes):
+        # bytea in hex format, its backslash is escaped below
+        value = '\\x' + value.hex()
+    return (str(value).replace('\\', '\\\\')
+                      .replace('\t', '\\t')
+                      .replace('\n', '\\n'))
@@ -0,0 +1,136 @@
+import threading
+import time
+from collections import OrderedDict
+
+'''
+LRUCache
+    a thread-safe, size-bounded cache that evicts the least recently used
+    entry, with an optional ttl in seconds so entries written by other
+    processes' changes cannot stay stale forever
+'''
+
+
+class LRUCache:
+
+    def __init__(self, maxsize, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (self.ttl is not None and
+                                 entry[1] < time.monotonic()):
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        expires = None if self.ttl is None else time.monotonic() + self.ttl
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+'''
+ResponseCache
+    a thread-safe cache of rendered response bodies bounded by their total
+    size in bytes. When a key is missing, only the first thread builds it;
+    other threads asking for the same key wait for that build instead of
+    running the same query at the same time.
+'''
+
+
+class ResponseCache:
+
+    def __init__(self, max_bytes, build_timeout=10):
+        self.max_bytes = max_bytes
+        self.build_timeout = build_timeout
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._building = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_or_build(self, key, build):
+        '''
+        Returns (entry, hit). build() returns the entry to store, a tuple
+        whose first item is the body bytes, or None to not cache it.
+        '''
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry, True
+                building = self._building.get(key)
+                if building is None:
+                    building = self._building[key] = threading.Event()
+                    self.misses += 1
+                    break
+                self.waits += 1
+            # another thread is building the key, use its result once it
+            # is done, or build it here if that takes too long
+            if not building.wait(self.build_timeout):
+                return build(), False
+
+        try:
+            entry = build()
+            if entry is not None:
+                self._store(key, entry)
+            return entry, False
+        finally:
+            with self._lock:
+                self._building.pop(key).set()
+
+    def stats(self):
+        return {
+          'entries': len(self._entries),
+          'bytes': self.size,
+          'max_bytes': self.max_bytes,
+          'hits': self.hits,
+          'misses': self.misses,
+          'waits': self.waits,
+          'evictions': self.evictions,
+        }
+
+    def _store(self, key, entry):
+        size = len(entry[0])
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous[0])
+            self._entries[key] = entry
+            self.size += size
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted[0])
+                self.evictions += 1
@@ -0,0 +1,340 @@
+from array import array
+
+import numpy as np
+from sqlalchemy import and_, func, or_
+from sqlalchemy.exc import IntegrityError
+
+from .models import db, Question, QuestionSignature, QuestionBand
+from . import bulk
+
+'''
+minhash
+    near-duplicate detection of question text. Each question's words are
+    hashed and reduced to a MinHash signature of NUM_PERM 32-bit values,
+    whose matching fraction between two questions estimates the Jaccard
+    similarity of their word sets. Signatures are split into BANDS bands
+    of ROWS values; questions sharing the bucket of any band are
+    candidates, and only candidates are compared.
+
+    All hashing runs in NumPy over whole batches of questions, and the
+    signatures and band buckets are stored, so a scan only hashes the
+    questions added since the last one.
+'''
+
+NUM_PERM = 128
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+# Default estimated similarity of a near-duplicate pair
+THRESHOLD = 0.7
+# Buckets shared by more questions are skipped, they come from very
+# short questions and would add pairs quadratically
+MAX_BUCKET = 64
+# Questions hashed and stored per batch
+CHUNK_SIZE = 10000
+
+# Stored signatures are little-endian, so they read the same everywhere
+SIGNATURE_DTYPE = np.dtype('<u4')
+# Signature slots of a question without words
+EMPTY = np.uint32(0xFFFFFFFF)
+
+_random = np.random.RandomState(20190601)
+# Permutation i maps a token hash x to (A[i] * x) ^ B[i] in 32 bits. Each
+# is a bijection since A[i] is odd, and one numpy operation hashes every
+# token of a batch for all permutations.
+_A = (_random.randint(0, 2 ** 32, (NUM_PERM, 1), dtype=np.uint64) |
+      np.uint64(1)).astype(np.uint32)
+_B = _random.randint(0, 2 ** 32, (NUM_PERM, 1),
+                     dtype=np.uint64).astype(np.uint32)
+# Random weight of a byte's position within its word
+_WEIGHTS = _random.randint(0, 2 ** 64, 32, dtype=np.uint64)
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+
+def token_hashes(texts):
+    '''
+    Returns the 32-bit hashes of the case-folded words of texts, and the
+    offset of each text's first hash. Words are runs of ASCII letters and
+    digits or of non-ASCII characters, and are hashed in one pass over
+    the bytes of all texts.
+    '''
+    joined = '\0'.join((text or '').replace('\0', ' ') for text in texts)
+    buffer = np.frombuffer(joined.casefold().encode('utf-8'),
+                           dtype=np.uint8)
+
+    word = (((buffer >= ord('0')) & (buffer <= ord('9'))) |
+            ((buffer >= ord('a')) & (buffer <= ord('z'))) |
+            (buffer >= 0x80))
+    first = word & ~np.concatenate(([False], word[:-1]))
+    starts = np.flatnonzero(first)
+
+    # each byte adds its value times the weight of its position
+    index = np.arange(len(buffer))
+    position = index - np.maximum.accumulate(np.where(first, index, 0))
+    weighted = buffer.astype(np.uint64) * _WEIGHTS[position % len(_WEIGHTS)]
+    weighted[~word] = 0
+    hashes = (np.add.reduceat(weighted, starts) if len(starts)
+              else np.zeros(0, dtype=np.uint64))
+    hashes ^= hashes >> np.uint64(29)
+    hashes *= _MIX
+    hashes = (hashes >> np.uint64(32)).astype(np.uint32)
+
+    # text of each word, counted by the separators before it
+    document = np.cumsum(buffer == 0)[starts]
+    offsets = np.searchsorted(document, np.arange(len(texts)))
+    return hashes, offsets
+
+
+def signatures(texts):
+    '''
+    Returns the (len(texts), NUM_PERM) uint32 signatures of texts
+    '''
+    result = np.full((len(texts), NUM_PERM), EMPTY, dtype=np.uint32)
+    for start in range(0, len(texts), CHUNK_SIZE):
+        chunk = texts[start:start + CHUNK_SIZE]
+        hashes, offsets = token_hashes(chunk)
+        words = np.diff(np.concatenate((offsets, [len(hashes)])))
+        if not words.any():
+            continue
+        permuted = np.multiply(_A, hashes)
+        np.bitwise_xor(permuted, _B, out=permuted)
+        nonempty = np.flatnonzero(words)
+        result[start + nonempty] = np.minimum.reduceat(
+            permuted, offsets[nonempty], axis=1).T
+    return result
+
+
+def band_keys(signatures):
+    '''
+    Returns the (len(signatures), BANDS) int64 bucket of each band
+    '''
+    rows = signatures.reshape(len(signatures), BANDS, ROWS).astype(np.uint64)
+    keys = np.zeros((len(signatures), BANDS), dtype=np.uint64)
+    for row in range(ROWS):
+        keys = keys * _MIX + rows[:, :, row]
+    return keys.view(np.int64)
+
+
+def candidate_pairs(keys, max_bucket=MAX_BUCKET):
+    '''
+    Returns the row indices (first, second) of signatures that share a
+    bucket in at least one band, with first < second and without repeats
+    '''
+    codes = []
+    for band in range(keys.shape[1]):
+        order = np.argsort(keys[:, band], kind='mergesort')
+        bucket = keys[order, band]
+        starts = np.flatnonzero(np.concatenate(([True],
+                                                bucket[1:] != bucket[:-1])))
+        sizes = np.diff(np.concatenate((starts, [len(bucket)])))
+        size = np.repeat(sizes, sizes)
+        usable = (size > 1) & (size <= max_bucket)
+        if not usable.any():
+            continue
+        order, bucket = order[usable], bucket[usable]
+
+        # the members of a bucket are adjacent, so pairs are rows that
+        # are 1, 2, ... apart in the same bucket
+        for distance in range(1, size[usable].max()):
+            same = np.flatnonzero(bucket[distance:] == bucket[:-distance])
+            first, second = order[same], order[same + distance]
+            codes.append(np.minimum(first, second).astype(np.uint64) <<
+                         np.uint64(32) |
+                         np.maximum(first, second).astype(np.uint64))
+
+    if not codes:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty
+    codes = np.unique(np.concatenate(codes))
+    return ((codes >> np.uint64(32)).astype(np.int64),
+            (codes & np.uint64(0xFFFFFFFF)).astype(np.int64))
+
+
+def similarity(signatures, first, second, chunk_size=100000):
+    '''
+    Returns the estimated Jaccard similarity of each pair of rows
+    '''
+    result = np.empty(len(first))
+    for start in range(0, len(first), chunk_size):
+        end = start + chunk_size
+        result[start:end] = (signatures[first[start:end]] ==
+                             signatures[second[start:end]]).mean(axis=1)
+    return result
+
+
+def table_rows(ids, signatures):
+    '''
+    Returns the question_signatures and question_bands rows of questions
+    ids as dicts
+    '''
+    keys = band_keys(signatures)
+    signature_rows = [
+        {'question_id': id,
+         'signature': signature.astype(SIGNATURE_DTYPE).tobytes()}
+        for id, signature in zip(ids, signatures)]
+    # questions without words share every bucket, so they get none
+    band_rows = [
+        {'question_id': id, 'band': band, 'bucket': int(bucket)}
+        for id, signature, row in zip(ids, signatures, keys)
+        if (signature != EMPTY).any()
+        for band, bucket in enumerate(row)]
+    return signature_rows, band_rows
+
+
+def store(ids, signatures):
+    '''
+    Adds the signatures and band buckets of questions ids to the session
+    '''
+    signature_rows, band_rows = table_rows(ids, signatures)
+    # executemany compiles each statement once for the whole batch
+    db.session.execute(QuestionSignature.__table__.insert(), signature_rows)
+    if band_rows:
+        db.session.execute(QuestionBand.__table__.insert(), band_rows)
+
+
+def copy_signatures(ids, signatures):
+    '''
+    Stores the signatures and band buckets of questions ids with COPY in
+    one transaction, skipping questions a concurrent check indexed first
+    '''
+    signature_rows, band_rows = table_rows(ids, signatures)
+    with bulk.raw_cursor() as cursor:
+        bulk.copy_rows(cursor, 'question_signatures',
+                       'question_id, signature', 'question_id',
+                       [(row['question_id'], row['signature'])
+                        for row in signature_rows])
+        bulk.copy_rows(cursor, 'question_bands',
+                       'question_id, band, bucket', 'question_id, band',
+                       [(row['question_id'], row['band'], row['bucket'])
+                        for row in band_rows])
+
+
+def index_missing(progress=None):
+    '''
+    Stores the signatures of questions that have none yet, in id order,
+    and returns how many were indexed. Postgres loads each batch with
+    COPY, other databases with executemany.
+    '''
+    indexed = 0
+    last_id = 0
+    while True:
+        rows = (db.session.query(Question.id, Question.question)
+                .outerjoin(QuestionSignature,
+                           QuestionSignature.question_id == Question.id)
+                .filter(QuestionSignature.question_id.is_(None),
+                        Question.id > last_id)
+                .order_by(Question.id)
+                .limit(CHUNK_SIZE)
+                .all())
+        if not rows:
+            return indexed
+
+        ids = [id for id, _ in rows]
+        batch = signatures([question for _, question in rows])
+        if db.engine.name == 'postgresql':
+            copy_signatures(ids, batch)
+        else:
+            store(ids, batch)
+        db.session.commit()
+        last_id = ids[-1]
+        indexed += len(ids)
+        if progress is not None:
+            progress(indexed)
+
+
+def unindexed():
+    '''
+    Returns the number of questions that have no signature yet
+    '''
+    return (db.session.query(func.count(Question.id))
+            .outerjoin(QuestionSignature,
+                       QuestionSignature.question_id == Question.id)
+            .filter(QuestionSignature.question_id.is_(None))
+            .scalar())
+
+
+def load_signatures(after=0, limit=None):
+    '''
+    Returns the ids and signatures of indexed questions, in id order,
+    with ids above after and at most limit of them
+    '''
+    ids = array('i')
+    data = bytearray()
+    query = (db.session.query(QuestionSignature.question_id,
+                              QuestionSignature.signature)
+             .join(Question, Question.id == QuestionSignature.question_id)
+             .filter(QuestionSignature.question_id > after)
+             .order_by(QuestionSignature.question_id)
+             .limit(limit)
+             .yield_per(CHUNK_SIZE))
+    for id, signature in query:
+        ids.append(id)
+        data += signature
+
+    return (np.frombuffer(ids, dtype=np.int32),
+            np.frombuffer(data, dtype=SIGNATURE_DTYPE).reshape(-1, NUM_PERM))
+
+
+def similar_pairs(ids, loaded, threshold=THRESHOLD, limit=None):
+    '''
+    Returns (question_id, question_id, similarity) for every pair of the
+    loaded signatures with an estimated similarity of at least threshold,
+    most similar first
+    '''
+    rows = np.flatnonzero((loaded != EMPTY).any(axis=1))
+    first, second = candidate_pairs(band_keys(loaded[rows]))
+    first, second = rows[first], rows[second]
+
+    scores = similarity(loaded, first, second)
+    found = np.flatnonzero(scores >= threshold)
+    found = found[np.argsort(-scores[found], kind='mergesort')][:limit]
+    return [(int(ids[first[pair]]), int(ids[second[pair]]),
+             round(float(scores[pair]), 4)) for pair in found]
+
+
+def near_duplicates(threshold=THRESHOLD, limit=None):
+    '''
+    Returns the near-duplicate pairs among every indexed question, see
+    similar_pairs
+    '''
+    return similar_pairs(*load_signatures(), threshold, limit)
+
+
+def check_question(question, threshold=THRESHOLD):
+    '''
+    Indexes a new question and returns the ids of indexed questions that
+    are near-duplicates of it, most similar first. Only its candidates
+    are read, through the band index.
+    '''
+    signature = signatures([question.question])
+    keys = band_keys(signature)[0]
+
+    similar = []
+    if (signature != EMPTY).any():
+        candidates = (db.session.query(QuestionBand.question_id)
+                      .filter(or_(*(and_(QuestionBand.band == band,
+                                         QuestionBand.bucket == int(key))
+                                    for band, key in enumerate(keys))),
+                              QuestionBand.question_id != question.id)
+                      .distinct()
+                      .limit(MAX_BUCKET * BANDS))
+        rows = (db.session.query(QuestionSignature.question_id,
+                                 QuestionSignature.signature)
+                .join(Question, Question.id == QuestionSignature.question_id)
+                .filter(QuestionSignature.question_id.in_(
+                    candidates.subquery()))
+                .all())
+        if rows:
+            others = np.frombuffer(b''.join(bytes(row[1]) for row in rows),
+                                   dtype=SIGNATURE_DTYPE)
+            scores = (others.reshape(-1, NUM_PERM) == signature).mean(axis=1)
+            similar = [rows[index][0] for index in
+                       np.argsort(-scores, kind='mergesort')
+                       if scores[index] >= threshold]
+
+    try:
+        store([question.id], signature)
+        db.session.commit()
+    except IntegrityError:
+        # a concurrent scan indexed the question first
+        db.session.rollback()
+    return similar
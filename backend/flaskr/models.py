@@ -1,9 +1,15 @@
 import os
-from sqlalchemy import Column, String, Integer, create_engine
+import hashlib
+from datetime import datetime
+from sqlalchemy import (Column, String, Integer, SmallInteger, BigInteger,
+                        Boolean, DateTime, LargeBinary, ForeignKey, Index,
+                        create_engine, text)
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 import json
 
+from .slowlog import SlowQueryLog
+
 
 database_path = os.environ.get('DATABASE_URL')
 
@@ -26,6 +32,31 @@ def setup_db(app, database_path=database_path):
     db.init_app(app)
     migrate = Migrate(app, db)
 
+    if app.config.get('SLOW_QUERY_LOG'):
+        slow_query_log = SlowQueryLog(
+            app.config['SLOW_QUERY_LOG'],
+            app.config.get('SLOW_QUERY_THRESHOLD_MS', 100),
+            app.config.get('SLOW_QUERY_LOG_MAX_BYTES', 10 * 2 ** 20),
+            app.config.get('SLOW_QUERY_LOG_BACKUPS', 5))
+        slow_query_log.register(db.get_engine(app))
+        app.extensions['slow_query_log'] = slow_query_log
+
+
+'''
+content_hash(question, answer)
+    hashes the case-folded, whitespace-collapsed question and answer,
+    so reformatted copies of a question share one hash
+'''
+
+
+def normalize_text(text):
+    return ' '.join((text or '').casefold().split())
+
+
+def content_hash(question, answer):
+    normalized = f'{normalize_text(question)}\x1f{normalize_text(answer)}'
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
 
 '''
 Question
@@ -40,22 +71,34 @@ class Question(db.Model):
     answer = Column(String)
     category = Column(String)
     difficulty = Column(Integer)
+    content_hash = Column(String(64), index=True, unique=True)
 
     def __init__(self, question, answer, category, difficulty):
         self.question = question
         self.answer = answer
         self.category = category
         self.difficulty = difficulty
+        self.content_hash = content_hash(question, answer)
 
     def insert(self):
         db.session.add(self)
+        # flush to get the id the change log refers to
+        db.session.flush()
+        record_change(self.id, 'insert')
         db.session.commit()
 
     def update(self):
+        self.content_hash = content_hash(self.question, self.answer)
+        # the text may have changed, the question is indexed again by the
+        # next near-duplicate scan
+        QuestionSignature.query.filter_by(question_id=self.id).delete()
+        QuestionBand.query.filter_by(question_id=self.id).delete()
+        record_change(self.id, 'update')
         db.session.commit()
 
     def delete(self):
         db.session.delete(self)
+        record_change(self.id, 'delete')
         db.session.commit()
 
     def format(self):
@@ -68,6 +111,89 @@ class Question(db.Model):
         }
 
 
+'''
+QuestionChange
+    the change log of the questions table. Every insert, update and
+    delete of a Question adds a row in the same transaction, so clients
+    can sync the changes after the last seq they saw. A reset tells them
+    to refetch everything, for example after a bulk load.
+'''
+
+# Advisory lock key serializing change log writers on Postgres
+CHANGE_LOG_LOCK = 0x7472697669610001
+
+
+class QuestionChange(db.Model):
+    __tablename__ = 'question_changes'
+
+    seq = Column(Integer, primary_key=True)
+    question_id = Column(Integer)
+    operation = Column(String(16), nullable=False)
+    changed_at = Column(DateTime, nullable=False)
+
+    def __init__(self, question_id, operation):
+        self.question_id = question_id
+        self.operation = operation
+        self.changed_at = datetime.utcnow()
+
+    def format(self):
+        return {
+          'seq': self.seq,
+          'question_id': self.question_id,
+          'operation': self.operation,
+          'changed_at': self.changed_at.isoformat()
+        }
+
+
+def record_change(question_id, operation):
+    '''
+    Adds a change to the current transaction. On Postgres, writers take a
+    transaction-scoped lock first, so changes commit in seq order and a
+    reader never sees seq 12 before a still-open seq 11.
+    '''
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(text('SELECT pg_advisory_xact_lock(:key)'),
+                           {'key': CHANGE_LOG_LOCK})
+    db.session.add(QuestionChange(question_id, operation))
+
+
+'''
+QuestionSignature
+    the MinHash signature of a question's text, see minhash.py. Rows are
+    added as questions are indexed and removed with their question.
+'''
+
+
+class QuestionSignature(db.Model):
+    __tablename__ = 'question_signatures'
+
+    question_id = Column(Integer,
+                         ForeignKey('questions.id', ondelete='CASCADE'),
+                         primary_key=True)
+    signature = Column(LargeBinary, nullable=False)
+
+
+'''
+QuestionBand
+    the LSH bucket of one band of a question's signature. Questions that
+    share a bucket in any band are near-duplicate candidates, so a new
+    question is checked with one indexed lookup per band.
+'''
+
+
+class QuestionBand(db.Model):
+    __tablename__ = 'question_bands'
+    __table_args__ = (
+        Index('ix_question_bands_band_bucket', 'band', 'bucket'),
+    )
+
+    question_id = Column(Integer,
+                         ForeignKey('questions.id', ondelete='CASCADE'),
+                         primary_key=True)
+    band = Column(SmallInteger, primary_key=True, autoincrement=False)
+    bucket = Column(BigInteger, nullable=False)
+
+
 '''
 Category
 '''
@@ -87,3 +213,33 @@ class Category(db.Model):
           'id': self.id,
           'type': self.type
         }
+
+
+'''
+QuizResult
+    one answered quiz question, written in batches by the quiz results
+    WriteBehindBuffer rather than committed per request
+'''
+
+
+class QuizResult(db.Model):
+    __tablename__ = 'quiz_results'
+
+    id = Column(Integer, primary_key=True)
+    quiz_id = Column(String(64), index=True)
+    question_id = Column(Integer, index=True, nullable=False)
+    quiz_category = Column(Integer)
+    correct = Column(Boolean, nullable=False)
+    score = Column(Integer)
+    answered_at = Column(DateTime, nullable=False)
+
+    def format(self):
+        return {
+          'id': self.id,
+          'quiz_id': self.quiz_id,
+          'question_id': self.question_id,
+          'quiz_category': self.quiz_category,
+          'correct': self.correct,
+          'score': self.score,
+          'answered_at': self.answered_at.isoformat()
+        }
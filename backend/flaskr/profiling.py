@@ -0,0 +1,144 @@
+import cProfile
+import functools
+import hmac
+import os
+import pstats
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict, deque
+
+from flask import g, request
+
+PROFILE_HEADER = 'X-Profile'
+
+'''
+RequestProfiler
+    wraps view dispatch in cProfile for requests that carry the profile
+    token in the X-Profile header, or for a random sample of requests,
+    and dumps a .pstats file named after the route and latency.
+    At most max_per_minute requests are profiled.
+'''
+
+
+class RequestProfiler:
+
+    def __init__(self, directory, token=None, sample_rate=0.0,
+                 max_per_minute=10, flamegraph=False):
+        self.directory = directory
+        self.token = token
+        self.sample_rate = sample_rate
+        self.max_per_minute = max_per_minute
+        self.flamegraph = flamegraph
+        self._recent = deque()
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def init_app(self, app):
+        dispatch_request = app.dispatch_request
+
+        @functools.wraps(dispatch_request)
+        def profiled_dispatch_request():
+            if not self.should_profile():
+                return dispatch_request()
+            return self.profile(dispatch_request)
+
+        app.dispatch_request = profiled_dispatch_request
+        app.after_request(self.add_profile_header)
+
+    def should_profile(self):
+        header = request.headers.get(PROFILE_HEADER)
+        if header is not None:
+            # the header is ignored unless a token is configured, and
+            # compared as bytes since compare_digest rejects non-ASCII str
+            requested = (self.token is not None and
+                         hmac.compare_digest(header.encode(),
+                                             self.token.encode()))
+        else:
+            requested = random.random() < self.sample_rate
+        return requested and self._allow()
+
+    def _allow(self):
+        now = time.monotonic()
+        with self._lock:
+            while self._recent and now - self._recent[0] >= 60:
+                self._recent.popleft()
+            if len(self._recent) >= self.max_per_minute:
+                return False
+            self._recent.append(now)
+            return True
+
+    def profile(self, dispatch_request):
+        profile = cProfile.Profile()
+        start = time.perf_counter()
+        try:
+            return profile.runcall(dispatch_request)
+        finally:
+            elapsed = time.perf_counter() - start
+            g.profile_id = self.dump(profile, elapsed)
+
+    def dump(self, profile, elapsed):
+        route = request.url_rule.rule if request.url_rule else request.path
+        route = re.sub(r'[^A-Za-z0-9]+', '_', route).strip('_') or 'root'
+        name = (f'{time.strftime("%Y%m%dT%H%M%S")}-{request.method}-{route}-'
+                f'{elapsed * 1000:.0f}ms-{uuid.uuid4().hex[:8]}')
+
+        path = os.path.join(self.directory, name)
+        profile.dump_stats(f'{path}.pstats')
+        if self.flamegraph:
+            with open(f'{path}.collapsed', 'w') as collapsed:
+                for stack, microseconds in collapsed_stacks(profile):
+                    collapsed.write(f'{stack} {microseconds}\n')
+        return name
+
+    def add_profile_header(self, response):
+        if 'profile_id' in g:
+            response.headers['X-Profile-Id'] = g.profile_id
+        return response
+
+
+def collapsed_stacks(profile, max_depth=64):
+    '''
+    Returns (stack, microseconds) pairs in the collapsed format read by
+    flamegraph.pl and speedscope. cProfile only records caller/callee
+    edges, so time is split between call paths in proportion to each
+    edge's cumulative time; stacks are an approximation.
+    '''
+    stats = pstats.Stats(profile).stats
+    children = defaultdict(list)
+    for function, (_, _, _, _, callers) in stats.items():
+        for caller, (_, _, _, cumulative) in callers.items():
+            children[caller].append((function, cumulative))
+
+    lines = Counter()
+
+    def walk(function, stack, share):
+        _, _, own, cumulative, _ = stats[function]
+        stack = stack + (function,)
+        lines[stack] += own * share
+        if len(stack) >= max_depth:
+            return
+        for child, edge in children[function]:
+            child_cumulative = stats[child][3]
+            if child in stack or not child_cumulative:
+                continue
+            child_share = edge * share / child_cumulative
+            if child_share * child_cumulative >= 1e-6:
+                walk(child, stack, child_share)
+
+    for function, (_, _, _, _, callers) in stats.items():
+        if not callers:
+            walk(function, (), 1.0)
+
+    return [(';'.join(_label(function) for function in stack),
+             round(seconds * 1e6))
+            for stack, seconds in lines.items() if round(seconds * 1e6)]
+
+
+def _label(function):
+    filename, line, name = function
+    if filename != '~':
+        name = f'{name} ({os.path.basename(filename)}:{line})'
+    return name.replace(';', ':')
@@ -0,0 +1,170 @@
+import glob
+import json
+import logging
+import re
+import time
+from datetime import datetime, timezone
+from logging.handlers import RotatingFileHandler
+
+from flask import has_request_context, request
+from sqlalchemy import event
+
+EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH')
+
+'''
+SlowQueryLog
+    records statements slower than a threshold, with the shape of their
+    bound parameters, the route that issued them and their query plan,
+    as one JSON object per line in a rotating log file
+'''
+
+
+class SlowQueryLog:
+
+    def __init__(self, path, threshold_ms=100, max_bytes=10 * 2 ** 20,
+                 backup_count=5):
+        self.path = path
+        self.threshold = threshold_ms / 1000
+        self.logger = logging.getLogger(f'{__name__}.{path}')
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        # apps sharing a log file share its handler, so rotation is safe
+        if not self.logger.handlers:
+            handler = RotatingFileHandler(path, maxBytes=max_bytes,
+                                          backupCount=backup_count)
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            self.logger.addHandler(handler)
+
+    def register(self, engine):
+        event.listen(engine, 'before_cursor_execute',
+                     self.before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute',
+                     self.after_cursor_execute)
+        event.listen(engine, 'handle_error', self.handle_error)
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters,
+                              context, executemany):
+        conn.info.setdefault('slow_query_start', []).append(
+            time.perf_counter())
+
+    def handle_error(self, context):
+        # failed statements never reach after_cursor_execute
+        if context.connection is not None:
+            starts = context.connection.info.get('slow_query_start')
+            if starts:
+                starts.pop()
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters,
+                             context, executemany):
+        elapsed = time.perf_counter() - conn.info['slow_query_start'].pop()
+        if elapsed < self.threshold:
+            return
+
+        record = {
+          'timestamp': datetime.now(timezone.utc).isoformat(),
+          'duration_ms': round(elapsed * 1000, 3),
+          'statement': statement,
+          'parameters': parameter_shape(parameters, executemany),
+          'route': None,
+          'method': None,
+          'plan': None,
+        }
+        if has_request_context():
+            record['route'] = (request.url_rule.rule if request.url_rule
+                               else request.path)
+            record['method'] = request.method
+        if not executemany:
+            record['plan'] = explain(conn, statement, parameters)
+
+        self.logger.info(json.dumps(record, default=str))
+
+
+def parameter_shape(parameters, executemany=False):
+    '''
+    Replaces bound values with their type names, so the log shows how a
+    statement was called without recording the data itself
+    '''
+    if executemany:
+        return {'rows': len(parameters),
+                'shape': parameter_shape(parameters[0]) if parameters
+                else None}
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__
+                for key, value in parameters.items()}
+    return [type(value).__name__ for value in parameters or ()]
+
+
+def explain(conn, statement, parameters):
+    '''
+    Returns the plan of statement, or None when it cannot be explained.
+    Runs on the raw DBAPI cursor so it is not itself recorded.
+    '''
+    if not statement.lstrip().upper().startswith(EXPLAINABLE):
+        return None
+
+    postgres = conn.dialect.name == 'postgresql'
+    prefix = 'EXPLAIN ' if postgres else 'EXPLAIN QUERY PLAN '
+    cursor = conn.connection.cursor()
+    try:
+        # a failed EXPLAIN must not abort the request's transaction
+        if postgres:
+            cursor.execute('SAVEPOINT slow_query_explain')
+        cursor.execute(prefix + statement, parameters)
+        plan = [str(row[-1]) for row in cursor.fetchall()]
+        if postgres:
+            cursor.execute('RELEASE SAVEPOINT slow_query_explain')
+        return plan
+    except Exception:
+        if postgres:
+            cursor.execute('ROLLBACK TO SAVEPOINT slow_query_explain')
+        return None
+    finally:
+        cursor.close()
+
+
+def read_records(path):
+    '''
+    Yields the records of a log file and its rotated backups, oldest first
+    '''
+    backups = sorted(glob.glob(f'{glob.escape(path)}.[0-9]*'),
+                     key=lambda name: int(name.rsplit('.', 1)[1]),
+                     reverse=True)
+    for name in backups + [path]:
+        try:
+            with open(name) as log:
+                for line in log:
+                    if line.strip():
+                        yield json.loads(line)
+        except FileNotFoundError:
+            continue
+
+
+def summarize(records, top=10):
+    '''
+    Groups records by statement and returns the top offenders by total
+    time as dictionaries of count, total, mean and max milliseconds
+    '''
+    groups = {}
+    for record in records:
+        statement = re.sub(r'\s+', ' ', record['statement']).strip()
+        group = groups.setdefault(statement, {
+          'statement': statement,
+          'count': 0,
+          'total_ms': 0,
+          'max_ms': 0,
+          'routes': set(),
+          'plan': None,
+        })
+        group['count'] += 1
+        group['total_ms'] += record['duration_ms']
+        group['max_ms'] = max(group['max_ms'], record['duration_ms'])
+        if record.get('route'):
+            group['routes'].add(f"{record['method']} {record['route']}")
+        group['plan'] = record.get('plan') or group['plan']
+
+    offenders = sorted(groups.values(), key=lambda group: group['total_ms'],
+                       reverse=True)[:top]
+    for group in offenders:
+        group['mean_ms'] = group['total_ms'] / group['count']
+        group['routes'] = sorted(group['routes'])
+    return offenders
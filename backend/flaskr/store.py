@@ -0,0 +1,215 @@
+import bisect
+import random
+import sys
+import threading
+import time
+from array import array
+
+from .models import db, Question
+
+# array('i') cannot hold None, so nullable integer columns use a sentinel
+NULL = -2 ** 31
+
+'''
+QuestionStore
+    a read-only snapshot of the questions table held as parallel arrays
+    instead of one ORM instance per row. Categories keep the form they
+    are stored in, the arrays hold a small code for each distinct value.
+'''
+
+
+class QuestionStore:
+    __slots__ = ('ids', 'categories', 'difficulties', 'questions', 'answers',
+                 'category_codes', 'category_offsets', 'category_ranges',
+                 'current_categories')
+
+    def __init__(self, rows):
+        '''
+        rows: iterable of (id, question, answer, category, difficulty)
+        tuples, ordered by id
+        '''
+        self.ids = array('i')
+        self.categories = array('i')
+        self.difficulties = array('i')
+        self.questions = []
+        self.answers = []
+        # distinct categories in order of their first question, and the
+        # code of each, looked up by its text like the database compares
+        self.current_categories = []
+        self.category_codes = {}
+
+        for id, question, answer, category, difficulty in rows:
+            key = _category_key(category)
+            code = self.category_codes.get(key)
+            if code is None:
+                code = self.category_codes[key] = len(self.current_categories)
+                self.current_categories.append(category)
+            self.ids.append(id)
+            self.categories.append(code)
+            self.difficulties.append(NULL if difficulty is None
+                                     else difficulty)
+            self.questions.append(_intern(question))
+            self.answers.append(_intern(answer))
+
+        # Offsets into the id-ordered arrays grouped by category, so every
+        # category is one contiguous range of category_offsets
+        order = sorted(range(len(self.ids)),
+                       key=lambda offset: (self.categories[offset],
+                                           self.ids[offset]))
+        self.category_offsets = array('i', order)
+        self.category_ranges = {}
+        start = 0
+        for position in range(1, len(order) + 1):
+            if (position == len(order) or
+                    self.categories[order[position]] !=
+                    self.categories[order[start]]):
+                category = self.categories[order[start]]
+                self.category_ranges[category] = (start, position)
+                start = position
+
+    def __len__(self):
+        return len(self.ids)
+
+    def format(self, offset):
+        return {
+          'id': self.ids[offset],
+          'question': self.questions[offset],
+          'answer': self.answers[offset],
+          'category': self.current_categories[self.categories[offset]],
+          'difficulty': _value(self.difficulties[offset])
+        }
+
+    def offset_of(self, question_id):
+        offset = bisect.bisect_left(self.ids, question_id)
+        if offset < len(self.ids) and self.ids[offset] == question_id:
+            return offset
+        return None
+
+    def category_code(self, category):
+        return self.category_codes.get(_category_key(category))
+
+    def category_range(self, category):
+        return self.category_ranges.get(self.category_code(category), (0, 0))
+
+    def questions_range(self, start, end):
+        start, end = max(start, 0), min(end, len(self.ids))
+        return [self.format(offset) for offset in range(start, end)]
+
+    def category_questions(self, category, start, end):
+        first, last = self.category_range(category)
+        # clamped to the category's range, so a page never reaches into
+        # the neighbouring categories
+        offsets = self.category_offsets[first + max(start, 0):
+                                        min(first + end, last)]
+        return [self.format(offset) for offset in offsets]
+
+    def random_question(self, category=None, previous_questions=()):
+        '''
+        Picks a random question, optionally within a category, that is not
+        one of previous_questions. Returns (offset, remaining) where offset
+        is None when no question is left.
+        '''
+        if category is None:
+            first, last = 0, len(self.ids)
+
+            def offset_at(position):
+                return position
+        else:
+            first, last = self.category_range(category)
+            offsets = self.category_offsets
+
+            def offset_at(position):
+                return offsets[position]
+
+        code = None if category is None else self.category_code(category)
+        excluded = set()
+        for question_id in previous_questions:
+            offset = self.offset_of(question_id)
+            if offset is None:
+                continue
+            if category is None or self.categories[offset] == code:
+                excluded.add(offset)
+
+        remaining = (last - first) - len(excluded)
+        if remaining <= 0:
+            return None, 0
+
+        # Rejection sampling is O(1) while most of the range is still
+        # available; fall back to filtering the range once it is not.
+        for _ in range(8):
+            offset = offset_at(random.randrange(first, last))
+            if offset not in excluded:
+                return offset, remaining
+        candidates = [offset_at(position) for position in range(first, last)
+                      if offset_at(position) not in excluded]
+        return random.choice(candidates), remaining
+
+    @classmethod
+    def load(cls):
+        rows = db.session.query(Question.id,
+                                Question.question,
+                                Question.answer,
+                                Question.category,
+                                Question.difficulty
+                                ).order_by(Question.id).yield_per(10000)
+        return cls(rows)
+
+
+def _intern(text):
+    return None if text is None else sys.intern(text)
+
+
+def _value(number):
+    return None if number == NULL else number
+
+
+def _category_key(category):
+    # categories are compared by their text, so 1 and '1' are the same
+    # category whether the column holds integers or strings
+    return None if category is None else str(category)
+
+
+'''
+QuestionRepository
+    holds the current QuestionStore of an app, loading it on first use
+    and again after invalidate() or once it is older than ttl seconds.
+    When generation is given, a callable returning the current data
+    generation, the store is also reloaded whenever that has changed
+    since it was loaded.
+'''
+
+
+class QuestionRepository:
+
+    def __init__(self, ttl=None, generation=None):
+        self.ttl = ttl
+        self.generation = generation
+        self._store = None
+        self._loaded_at = 0
+        self._loaded_generation = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        # read before loading, so a write during the load only causes
+        # another reload and never a stale store under a newer generation
+        generation = self.generation() if self.generation else None
+        store = self._store
+        if store is not None and not self._stale(generation):
+            return store
+
+        with self._lock:
+            if self._store is None or self._stale(generation):
+                self._store = QuestionStore.load()
+                self._loaded_at = time.monotonic()
+                self._loaded_generation = generation
+            return self._store
+
+    def invalidate(self):
+        self._store = None
+
+    def _stale(self, generation):
+        return self._expired() or generation != self._loaded_generation
+
+    def _expired(self):
+        return (self.ttl is not None and
+                time.monotonic() - self._loaded_at > self.ttl)
@@ -0,0 +1,159 @@
+import os
+import random
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from .models import db, content_hash, record_change, Question, Category
+from . import bulk
+
+TOPICS = ['Science', 'Art', 'Geography', 'History', 'Entertainment',
+          'Sports']
+OPENERS = ['What', 'Which', 'Who', 'Where', 'When', 'How many', 'In which',
+           'What is the name of the']
+SYLLABLES = ['ka', 'lo', 'mi', 'ten', 'ar', 'vel', 'os', 'ri', 'pa', 'dun',
+             'zo', 'ne', 'sha', 'tor', 'em', 'qui', 'bra', 'lin', 'ga', 'yu']
+# Weights for difficulty 1-5, most questions sit in the middle
+DIFFICULTY_WEIGHTS = [15, 30, 30, 20, 5]
+VOCABULARY_SIZE = 5000
+COLUMNS = 'question, answer, difficulty, category, content_hash'
+
+'''
+Synthetic questions
+    deterministic, seeded categories and questions for scale testing.
+    A given seed always produces the same rows regardless of how many
+    worker processes generate them.
+'''
+
+
+def vocabulary(seed):
+    rng = random.Random(f'{seed}:vocabulary')
+    words = set()
+    while len(words) < VOCABULARY_SIZE:
+        words.add(''.join(rng.choice(SYLLABLES)
+                          for _ in range(rng.randint(1, 4))))
+    return sorted(words)
+
+
+def category_names(count):
+    names = []
+    for index in range(count):
+        topic = TOPICS[index % len(TOPICS)]
+        names.append(topic if index < len(TOPICS)
+                     else f'{topic} {index // len(TOPICS) + 1}')
+    return names
+
+
+def generate_chunk(task):
+    '''
+    task: (seed, chunk index, number of questions, category ids)
+    returns a list of (question, answer, difficulty, category,
+    content_hash) tuples
+    '''
+    seed, index, count, category_ids = task
+    rng = random.Random(f'{seed}:{index}')
+    words = vocabulary(seed)
+
+    rows = []
+    for _ in range(count):
+        # Question lengths are roughly log-normal around ten words with a
+        # long tail, answers are one to a few words
+        length = min(40, max(3, int(rng.lognormvariate(2.2, 0.45))))
+        question = ' '.join([rng.choice(OPENERS)] +
+                            rng.choices(words, k=length)) + '?'
+        answer = ' '.join(rng.choices(words, k=min(5, 1 + int(
+            rng.expovariate(1.2))))).title()
+        difficulty = rng.choices(range(1, 6), DIFFICULTY_WEIGHTS)[0]
+        rows.append((question, answer, difficulty, rng.choice(category_ids),
+                     content_hash(question, answer)))
+    return rows
+
+
+def generate_tasks(seed, questions, chunk_size, category_ids):
+    index = 0
+    for start in range(0, questions, chunk_size):
+        yield (seed, index, min(chunk_size, questions - start), category_ids)
+        index += 1
+
+
+def insert_categories(count):
+    '''
+    Returns the ids of count categories, reusing existing categories with
+    the same name and inserting the missing ones
+    '''
+    names = category_names(count)
+    existing = {category.type: category for category in
+                Category.query.filter(Category.type.in_(names)).all()}
+    categories = [existing.get(name) or Category(name) for name in names]
+    db.session.add_all(categories)
+    db.session.commit()
+    return [category.id for category in categories]
+
+
+def copy_rows(rows):
+    '''
+    Loads rows with COPY, skipping rows whose content hash already exists.
+    Returns the number of rows inserted.
+    '''
+    with bulk.raw_cursor() as cursor:
+        return bulk.copy_rows(cursor, 'questions', COLUMNS, 'content_hash',
+                              rows)
+
+
+def executemany_rows(rows, batch_size=5000):
+    '''
+    Loads rows with batched executemany, for backends without COPY,
+    skipping rows whose content hash already exists.
+    Returns the number of rows inserted.
+    '''
+    columns = COLUMNS.split(', ')
+    statement = Question.__table__.insert().prefix_with('OR IGNORE',
+                                                        dialect='sqlite')
+    inserted = 0
+    with db.engine.begin() as connection:
+        for start in range(0, len(rows), batch_size):
+            result = connection.execute(
+                statement, [dict(zip(columns, row))
+                            for row in rows[start:start + batch_size]])
+            inserted += result.rowcount
+    return inserted
+
+
+def generate(questions, categories=6, seed=0, chunk_size=10000,
+             workers=None, progress=None):
+    '''
+    Inserts categories and questions, generating question text in a
+    process pool while the parent process loads finished chunks.
+    Returns the number of questions inserted, which is lower than
+    questions when some generated questions were duplicates.
+    '''
+    category_ids = insert_categories(categories)
+    load = copy_rows if db.engine.name == 'postgresql' else executemany_rows
+    tasks = generate_tasks(seed, questions, chunk_size, category_ids)
+    workers = workers or os.cpu_count() or 1
+
+    inserted = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # Keep a bounded window of chunks in flight and load them in task
+        # order, so memory stays flat and the assigned ids are
+        # deterministic too
+        window = deque()
+        for task in tasks:
+            window.append(executor.submit(generate_chunk, task))
+            if len(window) > workers * 2:
+                inserted += _load_next(window, load, progress, inserted)
+        while window:
+            inserted += _load_next(window, load, progress, inserted)
+
+    # the bulk load bypasses the per-question change log, so tell change
+    # feed clients to refetch
+    record_change(None, 'reset')
+    db.session.commit()
+
+    return inserted
+
+
+def _load_next(window, load, progress, inserted):
+    loaded = load(window.popleft().result())
+    if progress is not None:
+        progress(inserted + loaded)
+    return loaded
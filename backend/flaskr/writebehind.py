@@ -0,0 +1,164 @@
+import atexit
+import os
+import threading
+import time
+from collections import deque
+
+from .models import db
+
+'''
+WriteBehindBuffer
+    collects rows in memory and inserts them from a background thread in
+    multi-row INSERT statements, once max_batch rows are waiting or the
+    oldest row has waited max_delay seconds. Rows beyond capacity are
+    dropped and counted rather than blocking the request.
+'''
+
+
+class WriteBehindBuffer:
+
+    # rows per INSERT statement, keeps SQLite under its bound-parameter
+    # limit
+    ROWS_PER_STATEMENT = 100
+
+    def __init__(self, app, table, max_batch=500, max_delay=1.0,
+                 capacity=10000):
+        self.app = app
+        self.table = table
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.capacity = capacity
+
+        self.flushed = 0
+        self.dropped = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.last_flush_ms = None
+        self.max_flush_ms = 0
+
+        self._rows = deque()
+        self._oldest = None
+        self._retry_at = 0
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._closed = False
+        atexit.register(self.close)
+
+    def add(self, row):
+        '''
+        Queues row for insertion, returns False when it was dropped
+        '''
+        with self._condition:
+            if self._closed or len(self._rows) >= self.capacity:
+                self.dropped += 1
+                return False
+            if not self._rows:
+                self._oldest = time.monotonic()
+            self._rows.append(row)
+            self._ensure_started()
+            self._condition.notify()
+        return True
+
+    def flush(self):
+        '''
+        Inserts every queued row now, on the calling thread, after any
+        batch the background thread is inserting
+        '''
+        # held from the drain to the commit, so a caller that flushes and
+        # then queries sees every row added before the flush
+        with self._flush_lock:
+            with self._condition:
+                rows = list(self._rows)
+                self._rows.clear()
+                self._oldest = None
+            if rows:
+                self._insert(rows)
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout=self.max_delay + 5)
+        self.flush()
+
+    def stats(self):
+        return {
+          'depth': len(self._rows),
+          'capacity': self.capacity,
+          'flushed': self.flushed,
+          'dropped': self.dropped,
+          'flushes': self.flushes,
+          'failed_flushes': self.failed_flushes,
+          'last_flush_ms': self.last_flush_ms,
+          'max_flush_ms': self.max_flush_ms,
+        }
+
+    def _ensure_started(self):
+        # started on first use, and again in a forked worker, since
+        # threads do not survive fork
+        if self._thread is None or self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, daemon=True,
+                                            name='write-behind')
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._closed:
+                    due = self._next_flush()
+                    now = time.monotonic()
+                    if due is not None and due <= now:
+                        break
+                    self._condition.wait(None if due is None else due - now)
+                if self._closed:
+                    return
+            self.flush()
+
+    def _next_flush(self):
+        if not self._rows:
+            return None
+        if len(self._rows) >= self.max_batch:
+            due = time.monotonic()
+        else:
+            due = self._oldest + self.max_delay
+        # after a failed flush, wait max_delay before retrying
+        return max(due, self._retry_at)
+
+    def _insert(self, rows):
+        with self.app.app_context():
+            start = time.perf_counter()
+            try:
+                with db.engine.begin() as connection:
+                    for offset in range(0, len(rows),
+                                        self.ROWS_PER_STATEMENT):
+                        connection.execute(self.table.insert().values(
+                            rows[offset:offset + self.ROWS_PER_STATEMENT]))
+            except Exception:
+                self.failed_flushes += 1
+                self.app.logger.exception('write-behind flush of %d rows '
+                                          'failed', len(rows))
+                self._requeue(rows)
+                return
+
+            elapsed = (time.perf_counter() - start) * 1000
+            self.flushes += 1
+            self.flushed += len(rows)
+            self.last_flush_ms = round(elapsed, 3)
+            self.max_flush_ms = max(self.max_flush_ms, self.last_flush_ms)
+
+    def _requeue(self, rows):
+        # failed rows go back to the front to be retried by the next
+        # flush, as far as capacity allows
+        with self._condition:
+            room = max(0, self.capacity - len(self._rows))
+            if self._closed:
+                room = 0
+            self.dropped += len(rows) - min(room, len(rows))
+            self._rows.extendleft(reversed(rows[:room]))
+            if self._rows and self._oldest is None:
+                self._oldest = time.monotonic()
+            self._retry_at = time.monotonic() + self.max_delay
@@ -0,0 +1,80 @@
+"""add questions.content_hash
+
+Revision ID: 4b7e2c91d0a3
+Revises: dc5b1e15bc5f
+Create Date: 2026-10-19 09:12:41.503127
+
+"""
+import hashlib
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4b7e2c91d0a3'
+down_revision = 'dc5b1e15bc5f'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+
+questions = sa.table('questions',
+                     sa.column('id', sa.Integer),
+                     sa.column('question', sa.String),
+                     sa.column('answer', sa.String),
+                     sa.column('content_hash', sa.String))
+
+
+# Frozen copy of flaskr.models.content_hash, so later changes to the model
+# do not change what this migration writes
+def content_hash(question, answer):
+    def normalize(text):
+        return ' '.join((text or '').casefold().split())
+
+    normalized = f'{normalize(question)}\x1f{normalize(answer)}'
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+def upgrade():
+    op.add_column('questions',
+                  sa.Column('content_hash', sa.String(length=64),
+                            nullable=True))
+
+    # Backfill in id order, one batch at a time. Only the first copy of a
+    # duplicated question gets a hash, later copies stay NULL so the
+    # unique index can be built without deleting anything.
+    connection = op.get_bind()
+    update = questions.update().where(
+        questions.c.id == sa.bindparam('question_id')
+        ).values(content_hash=sa.bindparam('hash'))
+    seen = set()
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            sa.select([questions.c.id,
+                       questions.c.question,
+                       questions.c.answer])
+            .where(questions.c.id > last_id)
+            .order_by(questions.c.id)
+            .limit(BATCH_SIZE)).fetchall()
+        if not rows:
+            break
+
+        hashes = []
+        for id, question, answer in rows:
+            hash = content_hash(question, answer)
+            if hash not in seen:
+                seen.add(hash)
+                hashes.append({'question_id': id, 'hash': hash})
+        if hashes:
+            connection.execute(update, hashes)
+        last_id = rows[-1][0]
+
+    op.create_index(op.f('ix_questions_content_hash'), 'questions',
+                    ['content_hash'], unique=True)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_questions_content_hash'), table_name='questions')
+    op.drop_column('questions', 'content_hash')
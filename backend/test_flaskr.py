@@ -1,10 +1,74 @@
+import asyncio
 import os
+import tempfile
+import threading
 import unittest
 import json
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
 
 from flaskr import create_app
-from flaskr.models import setup_db, Question, Category
+from flaskr.models import (setup_db, db, content_hash, Question, Category,
+                           QuizResult, QuestionChange)
+from flaskr.store import QuestionStore
+from flaskr.cache import LRUCache, ResponseCache
+from flaskr import minhash, slowlog, synthetic
+
+try:
+    from flaskr.asgi import AsyncTrivia
+except ImportError:
+    AsyncTrivia = None
+
+
+class QueryCounter:
+    """Records the SQL statements an engine runs and the rows they return.
+
+    Row counts come from cursor.rowcount, which psycopg2 fills in for
+    SELECT statements.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+
+    def __enter__(self):
+        event.listen(self.engine, 'after_cursor_execute', self.record)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(self.engine, 'after_cursor_execute', self.record)
+
+    def record(self, conn, cursor, statement, parameters, context,
+               executemany):
+        self.statements.append((statement, parameters,
+                                max(cursor.rowcount, 0)))
+
+    @property
+    def rows(self):
+        return sum(rows for _, _, rows in self.statements)
+
+    def report(self):
+        return '\n'.join(f'  [{rows} rows] {statement} {parameters}'
+                         for statement, parameters, rows in self.statements)
+
+
+class QueryBudgetMixin:
+    """Fails a test when a request runs more statements or fetches more
+    rows than its budget allows"""
+
+    def assertQueryBudget(self, method, url, statements, rows, **kwargs):
+        with self.app.app_context():
+            engine = db.get_engine(self.app)
+        with QueryCounter(engine) as counter:
+            res = getattr(self.client(), method)(url, **kwargs)
+
+        self.assertEqual(res.status_code, 200)
+        if len(counter.statements) > statements or counter.rows > rows:
+            self.fail(f'{method.upper()} {url} ran '
+                      f'{len(counter.statements)} statements fetching '
+                      f'{counter.rows} rows, budget is {statements} '
+                      f'statements and {rows} rows:\n{counter.report()}')
+        return res
 
 
 class TriviaTestCase(unittest.TestCase):
@@ -85,6 +149,65 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], False)
         self.assertTrue(data['message'])
 
+    # Test a page before the first is served as the first page
+    def test_get_questions_page_zero(self):
+        res = self.client().get('/api/questions?page=0')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['questions'], json.loads(
+            self.client().get('/api/questions?page=1').data)['questions'])
+
+    # Test getting questions by id keeps the request order
+    def test_get_questions_by_ids(self):
+        res = self.client().get('/api/questions?ids=22,5,1000,9,5')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual([q['id'] for q in data['questions']], [22, 5, 9])
+        self.assertEqual(data['missing'], [1000])
+        self.assertEqual(data['total_questions'], 3)
+
+    # Test a malformed id list returns 400
+    def test_get_questions_by_ids_error(self):
+        res = self.client().get('/api/questions?ids=22,five')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['success'], False)
+
+    # Test long id lists can be posted
+    def test_post_questions_by_ids(self):
+        ids = list(range(1200, 0, -1))
+        res = self.client().post('/api/questions', json={'ids': ids})
+        data = json.loads(res.data)
+        total_questions = Question.query.filter(Question.id <= 1200).count()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['total_questions'], total_questions)
+        self.assertEqual(len(data['missing']), 1200 - total_questions)
+        self.assertEqual([q['id'] for q in data['questions']],
+                         sorted([q['id'] for q in data['questions']],
+                                reverse=True))
+
+    # Test get a single question
+    def test_get_question(self):
+        res = self.client().get('/api/questions/21')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['question']['answer'], 'Alexander Fleming')
+
+    # Test get a question that does not exist returns 404
+    def test_get_question_error(self):
+        res = self.client().get('/api/questions/1000')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['success'], False)
+
     '''
     POST Methods
     '''
@@ -117,6 +240,33 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], False)
         self.assertTrue(data['message'])
 
+    # Test posting a reformatted copy of a question is rejected
+    def test_post_question_duplicate(self):
+        res1 = self.client().post('/api/questions', json=self.new_question)
+        duplicate = dict(self.new_question,
+                         question=self.new_question['question'].upper(),
+                         answer='  jerry   rice ')
+        res2 = self.client().post('/api/questions', json=duplicate)
+        data1 = json.loads(res1.data)
+        data2 = json.loads(res2.data)
+
+        self.assertEqual(res1.status_code, 200)
+        self.assertEqual(res2.status_code, 409)
+        self.assertEqual(data2['success'], False)
+        self.assertEqual(data2['question_id'], data1['question_id'])
+
+        # Delete the question after running test
+        Question.query.get(data1['question_id']).delete()
+
+    # Test the content hash ignores case and whitespace
+    def test_content_hash(self):
+        self.assertEqual(content_hash('Who  discovered\tpenicillin?',
+                                      'Alexander Fleming'),
+                         content_hash('who discovered penicillin?',
+                                      ' ALEXANDER FLEMING'))
+        self.assertNotEqual(content_hash('Who discovered penicillin?', 'A'),
+                            content_hash('Who discovered penicillin? A', ''))
+
     # Test search for a question based on substring
     def test_search_question(self):
         res = self.client().post('/api/questions',
@@ -230,6 +380,741 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], True)
         self.assertEqual(data['total_questions'], 0)
 
+    # Test answers are buffered and written in a batch on flush
+    def test_quizzes_records_answer(self):
+        quiz_id = 'test-quizzes-records-answer'
+        for question_id, correct in [(20, True), (22, False)]:
+            res = self.client().post('/api/quizzes', json={
+                'quiz_category': {'id': '1'},
+                'previous_questions': [20, 22],
+                'answer': {'question_id': question_id, 'correct': correct},
+                'quiz_id': quiz_id,
+            })
+            self.assertEqual(res.status_code, 200)
+
+        stats = self.app.extensions['quiz_results'].stats()
+        self.app.extensions['quiz_results'].flush()
+        results = QuizResult.query.filter(
+            QuizResult.quiz_id == quiz_id).order_by(QuizResult.id).all()
+
+        self.assertEqual(stats['dropped'], 0)
+        self.assertEqual([(r.question_id, r.correct, r.quiz_category)
+                          for r in results],
+                         [(20, True, 1), (22, False, 1)])
+
+        # Delete the results after running test
+        QuizResult.query.filter(QuizResult.quiz_id == quiz_id).delete()
+        db.session.commit()
+
+    # Test a malformed answer returns 400
+    def test_quizzes_answer_error(self):
+        res = self.client().post('/api/quizzes', json={
+            'quiz_category': {'id': '1'},
+            'previous_questions': [],
+            'answer': {'question_id': 20},
+        })
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['success'], False)
+
+    # Test the write-behind counters are exposed
+    def test_metrics(self):
+        res = self.client().get('/api/metrics')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['quiz_results']['depth'], 0)
+        self.assertEqual(data['quiz_results']['dropped'], 0)
+
+    '''
+    CHANGE FEED
+    '''
+    # Test inserts and deletes show up in the change feed in order
+    def test_changes(self):
+        since = db.session.query(db.func.max(QuestionChange.seq)).scalar()
+        res1 = self.client().post('/api/questions', json=self.new_question)
+        question_id = json.loads(res1.data)['question_id']
+        self.client().delete(f'/api/questions/{question_id}')
+
+        res = self.client().get(f'/api/changes?since={since or 0}')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual([(c['operation'], c['question_id'])
+                          for c in data['changes']],
+                         [('insert', question_id), ('delete', question_id)])
+        self.assertIsNone(data['changes'][0]['question'])
+        self.assertEqual(data['latest'], data['changes'][-1]['seq'])
+        self.assertEqual(data['more'], False)
+
+    # Test an update ships the current text, not a cached copy
+    def test_changes_update(self):
+        cache_app = create_app({'QUESTION_CACHE_SIZE': 100})
+        setup_db(cache_app, self.database_path)
+        client = cache_app.test_client()
+        since = db.session.query(db.func.max(QuestionChange.seq)).scalar()
+        res1 = client.post('/api/questions', json=self.new_question)
+        question_id = json.loads(res1.data)['question_id']
+        client.get(f'/api/questions/{question_id}')
+        question = Question.query.get(question_id)
+        question.answer = 'Jerry Lee Rice'
+        question.update()
+
+        res = client.get(f'/api/changes?since={since or 0}')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['changes'][-1]['operation'], 'update')
+        self.assertEqual(data['changes'][-1]['question']['answer'],
+                         'Jerry Lee Rice')
+
+        # Delete the question after running test
+        client.delete(f'/api/questions/{question_id}')
+
+    # Test no changes after the latest seq
+    def test_changes_none(self):
+        res = self.client().get('/api/changes?since=1000000')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['changes'], [])
+        self.assertEqual(data['latest'], 1000000)
+
+    # Test the change stream sends changes as server-sent events
+    def test_changes_stream(self):
+        self.app.config['CHANGE_STREAM_TIMEOUT'] = 0.2
+        self.app.config['CHANGE_STREAM_POLL_INTERVAL'] = 0.05
+        since = db.session.query(db.func.max(QuestionChange.seq)).scalar()
+        res1 = self.client().post('/api/questions', json=self.new_question)
+        question_id = json.loads(res1.data)['question_id']
+
+        res = self.client().get('/api/changes/stream',
+                                headers={'Last-Event-ID': str(since or 0)})
+        body = res.get_data(as_text=True)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, 'text/event-stream')
+        self.assertIn('event: change', body)
+        self.assertIn(f'"question_id": {question_id}', body)
+
+        # Delete the question after running test
+        Question.query.get(question_id).delete()
+
+    '''
+    QUESTION STORE
+    '''
+    # Test the in-memory store serves the same first page as the database
+    def test_get_questions_from_store(self):
+        store_app = create_app({'QUESTION_STORE': True})
+        setup_db(store_app, self.database_path)
+
+        res = self.client().get('/api/questions')
+        store_res = store_app.test_client().get('/api/questions')
+
+        self.assertEqual(store_res.status_code, 200)
+        self.assertEqual(json.loads(store_res.data), json.loads(res.data))
+
+    # Test the store serves a quiz without previous questions
+    def test_quizzes_from_store(self):
+        store_app = create_app({'QUESTION_STORE': True})
+        setup_db(store_app, self.database_path)
+
+        res = store_app.test_client().post('/api/quizzes', json={
+            'quiz_category': {'id': 1}, 'previous_questions': None})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(str(data['question']['category']), '1')
+
+    '''
+    SLOW QUERY LOG
+    '''
+    # Test statements of a request are logged with its route and a plan
+    def test_slow_query_log(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'slow.ndjson')
+            log_app = create_app({'SLOW_QUERY_LOG': path,
+                                  'SLOW_QUERY_THRESHOLD_MS': 0})
+            setup_db(log_app, self.database_path)
+
+            res = log_app.test_client().get('/api/questions?page=1')
+            records = [record for record in slowlog.read_records(path)
+                       if record['route'] == '/api/questions']
+
+        page_query = next(record for record in records
+                          if 'LIMIT' in record['statement'])
+        # psycopg2 binds named parameters, sqlite positional ones
+        shape = page_query['parameters']
+        if isinstance(shape, dict):
+            shape = list(shape.values())
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(page_query['method'], 'GET')
+        self.assertEqual(set(shape), {'int'})
+        self.assertTrue(page_query['plan'])
+
+    '''
+    RESPONSE CACHE
+    '''
+    # Test a repeated page is a cache hit until a write bumps the generation
+    def test_response_cache(self):
+        cache_app = create_app({'RESPONSE_CACHE_MAX_BYTES': 2 ** 20})
+        setup_db(cache_app, self.database_path)
+        client = cache_app.test_client()
+
+        res1 = client.get('/api/questions')
+        res2 = client.get('/api/questions?page=1')
+        res_post = client.post('/api/questions', json=self.new_question)
+        res3 = client.get('/api/questions')
+
+        self.assertEqual(res1.headers['X-Cache'], 'MISS')
+        self.assertEqual(res2.headers['X-Cache'], 'HIT')
+        self.assertEqual(res2.data, res1.data)
+        self.assertEqual(res3.headers['X-Cache'], 'MISS')
+        self.assertEqual(json.loads(res3.data)['total_questions'],
+                         json.loads(res1.data)['total_questions'] + 1)
+
+        # Delete the question after running test
+        client.delete(
+            f"/api/questions/{json.loads(res_post.data)['question_id']}")
+
+    # Test a page cached by one worker after another worker's write is not
+    # rendered from a question store loaded before the write
+    def test_response_cache_with_store(self):
+        config = {'QUESTION_STORE': True, 'RESPONSE_CACHE_MAX_BYTES': 2 ** 20}
+        reader_app = create_app(config)
+        setup_db(reader_app, self.database_path)
+        writer_app = create_app(config)
+        setup_db(writer_app, self.database_path)
+        reader = reader_app.test_client()
+        writer = writer_app.test_client()
+
+        res1 = reader.get('/api/questions')
+        res_post = writer.post('/api/questions', json=self.new_question)
+        res2 = reader.get('/api/questions')
+
+        self.assertEqual(res2.headers['X-Cache'], 'MISS')
+        self.assertEqual(json.loads(res2.data)['total_questions'],
+                         json.loads(res1.data)['total_questions'] + 1)
+
+        # Delete the question after running test
+        writer.delete(
+            f"/api/questions/{json.loads(res_post.data)['question_id']}")
+
+    # Test error responses and other query arguments are not cached
+    def test_response_cache_bypass(self):
+        cache_app = create_app({'RESPONSE_CACHE_MAX_BYTES': 2 ** 20})
+        setup_db(cache_app, self.database_path)
+        client = cache_app.test_client()
+
+        res1 = client.get('/api/questions?page=1000')
+        res2 = client.get('/api/questions?ids=1')
+
+        self.assertEqual(res1.status_code, 404)
+        self.assertNotIn('X-Cache', res1.headers)
+        self.assertNotIn('X-Cache', res2.headers)
+        self.assertEqual(len(cache_app.extensions['response_cache']), 0)
+
+    '''
+    NEAR DUPLICATES
+    '''
+    # Test a reworded copy of a new question is reported on creation
+    def test_post_question_near_duplicates(self):
+        check_app = create_app({'NEAR_DUPLICATES': True})
+        setup_db(check_app, self.database_path)
+        client = check_app.test_client()
+        reworded = dict(self.new_question, question=(
+            "What position player holds the NFL record for the most "
+            "touchdowns?"))
+
+        res1 = client.post('/api/questions', json=self.new_question)
+        res2 = client.post('/api/questions', json=reworded)
+        data1 = json.loads(res1.data)
+        data2 = json.loads(res2.data)
+
+        self.assertEqual(res2.status_code, 200)
+        self.assertEqual(data2['near_duplicates'], [data1['question_id']])
+
+        # Delete the questions after running test
+        client.delete(f"/api/questions/{data1['question_id']}")
+        client.delete(f"/api/questions/{data2['question_id']}")
+
+    # Test a failed check is left out instead of failing the create
+    def test_post_question_near_duplicates_error(self):
+        # an invalid threshold fails the check once there are candidates
+        check_app = create_app({'NEAR_DUPLICATES': True,
+                                'NEAR_DUPLICATE_THRESHOLD': None})
+        setup_db(check_app, self.database_path)
+        client = check_app.test_client()
+        reworded = dict(self.new_question, question=(
+            "What position player holds the NFL record for the most "
+            "touchdowns?"))
+
+        res1 = client.post('/api/questions', json=self.new_question)
+        res2 = client.post('/api/questions', json=reworded)
+        data2 = json.loads(res2.data)
+
+        self.assertEqual(res2.status_code, 200)
+        self.assertTrue(data2['question_id'])
+        self.assertNotIn('near_duplicates', data2)
+
+        # Delete the questions after running test
+        client.delete(
+            f"/api/questions/{json.loads(res1.data)['question_id']}")
+        client.delete(f"/api/questions/{data2['question_id']}")
+
+    # Test the admin endpoint lists reworded pairs from the index
+    def test_near_duplicates(self):
+        admin_app = create_app({'ADMIN_TOKEN': 'secret',
+                                'NEAR_DUPLICATES': True})
+        setup_db(admin_app, self.database_path)
+        client = admin_app.test_client()
+        reworded = dict(self.new_question, question=(
+            "What position player holds the NFL record for the most "
+            "touchdowns?"))
+        ids = [json.loads(client.post('/api/questions', json=question).data)
+               ['question_id'] for question in (self.new_question, reworded)]
+
+        res = client.get('/api/admin/near-duplicates',
+                         headers={'Authorization': 'Bearer secret'})
+        data = json.loads(res.data)
+        # a window starting after the first question cannot pair it
+        res_after = client.get(
+            f'/api/admin/near-duplicates?after={ids[0]}',
+            headers={'Authorization': 'Bearer secret'})
+        data_after = json.loads(res_after.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertIn(ids, [pair['question_ids'] for pair in data['pairs']])
+        self.assertIsNone(data['next_after'])
+        self.assertNotIn(ids, [pair['question_ids']
+                               for pair in data_after['pairs']])
+
+        # Delete the questions after running test
+        for question_id in ids:
+            client.delete(f'/api/questions/{question_id}')
+
+    # Test the admin endpoint requires the token
+    def test_near_duplicates_error(self):
+        admin_app = create_app({'ADMIN_TOKEN': 'secret'})
+        setup_db(admin_app, self.database_path)
+
+        res1 = admin_app.test_client().get('/api/admin/near-duplicates')
+        res2 = self.client().get('/api/admin/near-duplicates')
+        res3 = admin_app.test_client().get(
+            '/api/admin/near-duplicates',
+            headers={'Authorization': 'Bearer café'})
+
+        self.assertEqual(res1.status_code, 401)
+        self.assertEqual(json.loads(res1.data)['message'], 'Unauthorized')
+        self.assertEqual(res2.status_code, 404)
+        self.assertEqual(res3.status_code, 401)
+
+
+@unittest.skipIf(AsyncTrivia is None, 'requirements-async.txt not installed')
+class AsyncTriviaTestCase(unittest.TestCase):
+    """This class checks the ASGI entry point returns the same responses
+    as the Flask views"""
+
+    def setUp(self):
+        self.app = create_app()
+        self.database_path = "postgresql://postgres@{}/{}".format(
+            'localhost:5432',
+            'trivia_test'
+            )
+        setup_db(self.app, self.database_path)
+        self.client = self.app.test_client
+
+    def request(self, requests):
+        '''
+        Sends (method, path, query, body) requests to a new AsyncTrivia
+        and returns their (status, body) responses
+        '''
+        async def send_all():
+            trivia = AsyncTrivia(self.app)
+            responses = []
+            for method, path, query, body in requests:
+                messages = []
+                payload = json.dumps(body).encode() if body else b''
+                scope = {
+                  'type': 'http',
+                  'method': method,
+                  'path': path,
+                  'query_string': query.encode(),
+                  'headers': [(b'content-type', b'application/json')],
+                  'http_version': '1.1',
+                  'scheme': 'http',
+                  'root_path': '',
+                  'server': ('localhost', 80),
+                  'client': ('127.0.0.1', 0),
+                }
+
+                async def receive():
+                    return {'type': 'http.request', 'body': payload}
+
+                async def send(message):
+                    messages.append(message)
+
+                await trivia(scope, receive, send)
+                responses.append((messages[0]['status'], b''.join(
+                    message.get('body', b'') for message in messages[1:])))
+            if trivia.pool is not None:
+                await trivia.pool.close()
+            return responses
+
+        return asyncio.run(send_all())
+
+    # Test the read endpoints return the same JSON as the Flask app
+    def test_same_responses(self):
+        requests = [
+            ('GET', '/api/categories', '', None),
+            ('GET', '/api/questions', '', None),
+            ('GET', '/api/questions', 'page=2', None),
+            ('GET', '/api/questions', 'page=1000', None),
+            ('GET', '/api/categories/1/questions', '', None),
+            ('GET', '/api/questions', 'ids=2,4', None),
+        ]
+        responses = self.request(requests)
+
+        for (method, path, query, _), (status, body) in zip(requests,
+                                                            responses):
+            res = self.client().open(path, method=method,
+                                     query_string=query)
+            self.assertEqual(status, res.status_code)
+            self.assertEqual(json.loads(body), json.loads(res.data))
+
+    # Test a quiz returns the only question left in its category
+    def test_quizzes(self):
+        ids = [question.id for question in
+               Question.query.filter(Question.category == '1')]
+        quiz = {
+            'previous_questions': ids[1:],
+            'quiz_category': {'id': 1}
+        }
+
+        [(status, body)] = self.request([('POST', '/api/quizzes', '', quiz)])
+        res = self.client().post('/api/quizzes', json=quiz)
+
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body), json.loads(res.data))
+        self.assertEqual(json.loads(body)['question']['id'], ids[0])
+
+    # Test a bad answer fails the same way as in the Flask app
+    def test_quizzes_answer_error(self):
+        quiz = {
+            'previous_questions': [],
+            'quiz_category': {'id': 0},
+            'answer': {'question_id': 'x', 'correct': True}
+        }
+
+        [(status, body)] = self.request([('POST', '/api/quizzes', '', quiz)])
+
+        self.assertEqual(status, 400)
+        self.assertEqual(json.loads(body)['message'], 'Bad Request')
+
+
+class QueryBudgetTestCase(QueryBudgetMixin, unittest.TestCase):
+    """This class checks the per-endpoint query budgets on a 10k-row
+    fixture, so a full-table read shows up as a failure"""
+
+    fixture_questions = 10000
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app = create_app()
+        cls.database_path = "postgresql://postgres@{}/{}".format(
+            'localhost:5432',
+            'trivia_test'
+            )
+        setup_db(cls.app, cls.database_path)
+
+        with cls.app.app_context():
+            cls.last_id = db.session.query(db.func.max(Question.id)).scalar()
+            category_ids = synthetic.insert_categories(6)
+            synthetic.copy_rows(synthetic.generate_chunk(
+                (0, 0, cls.fixture_questions, category_ids)))
+
+    @classmethod
+    def tearDownClass(cls):
+        with cls.app.app_context():
+            Question.query.filter(Question.id > cls.last_id).delete()
+            db.session.commit()
+
+    def setUp(self):
+        self.client = self.app.test_client
+
+    # Test a page of questions does not load the whole table
+    def test_get_questions_budget(self):
+        self.assertQueryBudget('get', '/api/questions?page=2',
+                               statements=4, rows=30)
+
+    # Test a category page only fetches its own page
+    def test_questions_by_category_budget(self):
+        self.assertQueryBudget('get', '/api/categories/1/questions?page=2',
+                               statements=1, rows=10)
+
+    # Test categories are read in a single statement
+    def test_get_categories_budget(self):
+        self.assertQueryBudget('get', '/api/categories',
+                               statements=1, rows=6)
+
+    # Test a search only fetches the requested page
+    def test_search_question_budget(self):
+        self.assertQueryBudget('post', '/api/questions',
+                               statements=1, rows=10,
+                               json={'searchTerm': 'ka'})
+
+    # Test a quiz round counts the candidates and fetches a single row
+    def test_quizzes_budget(self):
+        self.assertQueryBudget('post', '/api/quizzes',
+                               statements=2, rows=2,
+                               json={'quiz_category': {'id': 1},
+                                     'previous_questions': [20, 22]})
+
+
+class QuestionStoreTestCase(unittest.TestCase):
+    """This class represents the in-memory question store test case"""
+
+    def setUp(self):
+        self.store = QuestionStore([
+            (2, 'Apollo 13?', 'Apollo 13', 5, 4),
+            (5, 'Caged Bird?', 'Maya Angelou', 4, 2),
+            (20, 'Heaviest organ?', 'The Liver', 1, 4),
+            (21, 'Penicillin?', 'Alexander Fleming', 1, 3),
+            (22, 'Hematology?', 'Blood', 1, None),
+            (23, 'Bones?', '206', 'Anatomy', 2),
+        ])
+
+    # Test rows keep their id order and current categories their first use
+    def test_questions_range(self):
+        questions = self.store.questions_range(1, 3)
+
+        self.assertEqual([q['id'] for q in questions], [5, 20])
+        self.assertEqual(self.store.current_categories, [5, 4, 1, 'Anatomy'])
+        self.assertIsNone(self.store.format(4)['difficulty'])
+        self.assertEqual(self.store.questions_range(-10, 0), [])
+
+    # Test a category is served from its precomputed offset range
+    def test_category_questions(self):
+        questions = self.store.category_questions('1', 1, 10)
+
+        self.assertEqual([q['id'] for q in questions], [21, 22])
+        self.assertEqual(self.store.category_questions(30, 0, 10), [])
+        # a page before the first stays within the category
+        self.assertEqual(self.store.category_questions(4, -10, 0), [])
+        self.assertEqual(
+            self.store.category_questions('Anatomy', 0, 10)[0]['category'],
+            'Anatomy')
+
+    # Test previous questions are excluded from the random pick
+    def test_random_question(self):
+        offset, remaining = self.store.random_question(1, [20, 22, 5])
+
+        self.assertEqual(self.store.ids[offset], 21)
+        self.assertEqual(remaining, 1)
+        self.assertEqual(self.store.random_question(1, [20, 21, 22]),
+                         (None, 0))
+
+
+class SyntheticTestCase(unittest.TestCase):
+    """This class represents the synthetic dataset generator test case"""
+
+    # Test the same seed and chunk always generate the same rows
+    def test_generate_chunk_is_deterministic(self):
+        task = (42, 3, 100, [1, 2, 3])
+        rows = synthetic.generate_chunk(task)
+
+        self.assertEqual(rows, synthetic.generate_chunk(task))
+        self.assertNotEqual(rows, synthetic.generate_chunk((43, 3, 100,
+                                                            [1, 2, 3])))
+        self.assertEqual(len(rows), 100)
+        for question, answer, difficulty, category, content_hash in rows:
+            self.assertTrue(question.endswith('?'))
+            self.assertTrue(answer)
+            self.assertIn(difficulty, range(1, 6))
+            self.assertIn(category, [1, 2, 3])
+
+    # Test chunks cover exactly the requested number of questions
+    def test_generate_tasks(self):
+        tasks = list(synthetic.generate_tasks(0, 25, 10, [1]))
+
+        self.assertEqual([task[2] for task in tasks], [10, 10, 5])
+        self.assertEqual([task[1] for task in tasks], [0, 1, 2])
+
+
+class LRUCacheTestCase(unittest.TestCase):
+    """This class represents the LRU cache test case"""
+
+    # Test the least recently used entry is evicted first
+    def test_eviction(self):
+        cache = LRUCache(2)
+        cache.set(1, 'a')
+        cache.set(2, 'b')
+        cache.get(1)
+        cache.set(3, 'c')
+
+        self.assertEqual(cache.get(1), 'a')
+        self.assertIsNone(cache.get(2))
+        self.assertEqual(cache.get(3), 'c')
+        self.assertEqual((cache.hits, cache.misses), (3, 1))
+
+    # Test expired entries are not returned
+    def test_ttl(self):
+        cache = LRUCache(2, ttl=-1)
+        cache.set(1, 'a')
+
+        self.assertIsNone(cache.get(1))
+
+
+class ResponseCacheTestCase(unittest.TestCase):
+    """This class represents the response cache test case"""
+
+    # Test entries are evicted once their bodies exceed max_bytes
+    def test_eviction(self):
+        cache = ResponseCache(10)
+        cache.get_or_build('a', lambda: (b'aaaa',))
+        cache.get_or_build('b', lambda: (b'bbbb',))
+        cache.get_or_build('c', lambda: (b'cccc',))
+        cache.get_or_build('d', lambda: (b'd' * 11,))
+
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.size, 8)
+        self.assertEqual(cache.evictions, 1)
+        self.assertEqual(cache.get_or_build('c', lambda: None),
+                         ((b'cccc',), True))
+
+    # Test concurrent misses of one key run a single build
+    def test_single_build(self):
+        cache = ResponseCache(100)
+        started = threading.Event()
+        release = threading.Event()
+        builds = []
+
+        def build():
+            builds.append(1)
+            started.set()
+            release.wait(5)
+            return (b'body',)
+
+        threads = [threading.Thread(target=cache.get_or_build,
+                                    args=('key', build)) for _ in range(5)]
+        threads[0].start()
+        started.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(len(builds), 1)
+        self.assertEqual((cache.misses, cache.hits), (1, 4))
+
+
+class MinHashTestCase(unittest.TestCase):
+    """This class represents the MinHash near-duplicate test case"""
+
+    texts = [
+        'Which position player holds the NFL record for most touchdowns?',
+        'what position player holds the NFL record, for the most touchdowns',
+        'Whose autobiography is entitled I Know Why the Caged Bird Sings?',
+        '?!',
+    ]
+
+    # Test signatures estimate the similarity of the texts' words
+    def test_signatures(self):
+        signatures = minhash.signatures(self.texts)
+        scores = minhash.similarity(signatures, [0, 0], [1, 2])
+
+        self.assertEqual(signatures.shape, (4, minhash.NUM_PERM))
+        self.assertGreater(scores[0], 0.6)
+        self.assertLess(scores[1], 0.3)
+        self.assertTrue((signatures[3] == minhash.EMPTY).all())
+
+    # Test only texts sharing a band bucket become candidate pairs
+    def test_candidate_pairs(self):
+        keys = minhash.band_keys(minhash.signatures(self.texts[:3] * 2))
+        first, second = minhash.candidate_pairs(keys)
+
+        self.assertEqual(list(zip(first, second)),
+                         [(0, 1), (0, 3), (0, 4), (1, 3), (1, 4), (2, 5),
+                          (3, 4)])
+
+
+class SlowQueryLogTestCase(unittest.TestCase):
+    """This class represents the slow query log test case"""
+
+    # Test bound values are logged as their types only
+    def test_parameter_shape(self):
+        self.assertEqual(slowlog.parameter_shape({'id': 1, 'q': 'x'}),
+                         {'id': 'int', 'q': 'str'})
+        self.assertEqual(slowlog.parameter_shape((10, 20)), ['int', 'int'])
+        self.assertEqual(slowlog.parameter_shape([(1,), (2,)], True),
+                         {'rows': 2, 'shape': ['int']})
+
+    # Test the summary ranks statements by total time
+    def test_summarize(self):
+        records = [
+            {'statement': 'SELECT 1', 'duration_ms': 150,
+             'route': '/api/questions', 'method': 'GET', 'plan': None},
+            {'statement': 'SELECT  2', 'duration_ms': 120,
+             'route': None, 'method': None, 'plan': ['SCAN questions']},
+            {'statement': 'SELECT \n2', 'duration_ms': 100,
+             'route': '/api/quizzes', 'method': 'POST', 'plan': None},
+        ]
+        offenders = slowlog.summarize(records, top=1)
+
+        self.assertEqual(len(offenders), 1)
+        self.assertEqual(offenders[0]['statement'], 'SELECT 2')
+        self.assertEqual(offenders[0]['count'], 2)
+        self.assertEqual(offenders[0]['total_ms'], 220)
+        self.assertEqual(offenders[0]['routes'], ['POST /api/quizzes'])
+        self.assertEqual(offenders[0]['plan'], ['SCAN questions'])
+
+
+class ProfilingTestCase(unittest.TestCase):
+    """This class represents the per-request profiling test case"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.app = create_app({
+            'PROFILE_DIR': self.directory.name,
+            'PROFILE_TOKEN': 'secret',
+            'PROFILE_MAX_PER_MINUTE': 2,
+            'PROFILE_FLAMEGRAPH': True,
+        })
+        self.client = self.app.test_client
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    # Test only requests with the right token are profiled
+    def test_profile_requires_token(self):
+        res = self.client().get('/', headers={'X-Profile': 'guess'})
+        res_non_ascii = self.client().get('/', headers={'X-Profile': 'café'})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res_non_ascii.status_code, 200)
+        self.assertNotIn('X-Profile-Id', res.headers)
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+    # Test profiled requests dump stats until the per-minute cap
+    def test_profile_dumps_stats(self):
+        profile_ids = []
+        for _ in range(3):
+            res = self.client().get('/', headers={'X-Profile': 'secret'})
+            profile_ids.append(res.headers.get('X-Profile-Id'))
+
+        self.assertTrue(all(profile_ids[:2]))
+        self.assertIsNone(profile_ids[2])
+        for profile_id in profile_ids[:2]:
+            self.assertIn('-GET-root-', profile_id)
+            path = os.path.join(self.directory.name, profile_id)
+            self.assertTrue(os.path.exists(f'{path}.pstats'))
+            self.assertTrue(os.path.exists(f'{path}.collapsed'))
+
 
 # Make the tests conveniently executable
 if __name__ == "__main__":
@@ -1,8 +1,9 @@
-from flask_script import Manager
+from flask_script import Command, Manager, Option
 from flask_migrate import Migrate, MigrateCommand
 
 from backend.flaskr import APP
-from backend.flaskr.models import db
+from backend.flaskr.models import db, Question
+from backend.flaskr import slowlog, synthetic
 
 migrate = Migrate(APP, db)
 manager = Manager(APP)
@@ -10,5 +11,97 @@ manager = Manager(APP)
 manager.add_command('db', MigrateCommand)
 
 
+@manager.option('--questions', type=int, default=1000000,
+                help='Number of questions to generate (default 1000000).')
+@manager.option('--categories', type=int, default=6,
+                help='Number of categories to create (default 6).')
+@manager.option('--seed', type=int, default=0,
+                help='Seed, the same seed always generates the same rows.')
+@manager.option('--chunk-size', type=int, default=10000,
+                help='Questions generated and loaded per batch.')
+@manager.option('--workers', type=int, default=None,
+                help='Generator processes, defaults to the CPU count.')
+def generate(questions, categories, seed, chunk_size, workers):
+    '''Generate synthetic categories and questions for scale testing.'''
+    def progress(inserted):
+        print(f'\r{inserted}/{questions} questions', end='', flush=True)
+
+    inserted = synthetic.generate(questions, categories, seed, chunk_size,
+                                  workers, progress)
+    print(f'\nInserted {categories} categories and {inserted} '
+          f'questions, skipped {questions - inserted} duplicates.')
+
+
+class SlowQueries(Command):
+    '''Summarize the slow query log by total time per statement.'''
+
+    option_list = (
+        Option('--log', dest='path', default=None,
+               help='Slow query log, defaults to SLOW_QUERY_LOG.'),
+        Option('--top', type=int, default=10,
+               help='Number of statements to show (default 10).'),
+        Option('--plans', action='store_true',
+               help='Show the captured query plan of each statement.'),
+    )
+
+    def run(self, path, top, plans):
+        path = path or APP.config['SLOW_QUERY_LOG']
+        if not path:
+            raise SystemExit('Pass --log or set SLOW_QUERY_LOG.')
+
+        offenders = slowlog.summarize(slowlog.read_records(path), top)
+        if not offenders:
+            print('No slow queries recorded.')
+        for rank, group in enumerate(offenders, 1):
+            print(f"{rank}. total {group['total_ms']:.1f} ms, "
+                  f"{group['count']} calls, mean {group['mean_ms']:.1f} ms, "
+                  f"max {group['max_ms']:.1f} ms")
+            print(f"   {group['statement']}")
+            if group['routes']:
+                print(f"   routes: {', '.join(group['routes'])}")
+            if plans and group['plan']:
+                for line in group['plan']:
+                    print(f'     {line}')
+
+
+manager.add_command('slow-queries', SlowQueries())
+
+
+class NearDuplicates(Command):
+    '''Index new questions and list near-duplicate pairs.'''
+
+    option_list = (
+        Option('--threshold', type=float, default=None,
+               help='Estimated similarity of a near-duplicate pair '
+                    '(default 0.7).'),
+        Option('--limit', type=int, default=100,
+               help='Number of pairs to show (default 100).'),
+    )
+
+    def run(self, threshold, limit):
+        # imported here, the other commands do not need NumPy
+        from backend.flaskr import minhash
+
+        def progress(indexed):
+            print(f'\rIndexed {indexed} questions', end='', flush=True)
+
+        indexed = minhash.index_missing(progress)
+        print(f'\rIndexed {indexed} new questions.')
+
+        pairs = minhash.near_duplicates(threshold or minhash.THRESHOLD,
+                                        limit)
+        if not pairs:
+            print('No near-duplicates found.')
+        questions = {question.id: question for question in
+                     Question.query.filter(Question.id.in_(
+                         {id for pair in pairs for id in pair[:2]}))}
+        for first, second, score in pairs:
+            print(f'{score:.2f}  #{first}: {questions[first].question}')
+            print(f'      #{second}: {questions[second].question}')
+
+
+manager.add_command('near-duplicates', NearDuplicates())
+
+
 if __name__ == '__main__':
-    manager.run()
\ No newline at end of file
+    manager.run()